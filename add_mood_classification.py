@@ -6,9 +6,16 @@ Uses OpenAI to classify video titles or summaries into predefined categories.
 import os
 import sys
 import json
-import glob
-from openai import OpenAI
+import asyncio
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import orjson
+from aiolimiter import AsyncLimiter
+from openai import AsyncOpenAI, InternalServerError, RateLimitError
 from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 
 # Load environment variables from .env file
 load_dotenv()
@@ -30,33 +37,144 @@ CATEGORIES = [
     "Ethics, Context & Impact"
 ]
 
-def classify_text(client: OpenAI, text: str, text_type: str = "title") -> str:
+# Static prompt text, built once at import. The variable part of each
+# request goes last so the shared prefix can hit OpenAI's prompt cache.
+CATEGORIES_BLOCK = "\n".join(f"- {cat}" for cat in CATEGORIES)
+
+TITLE_SYSTEM_MSG = "You are a classifier that categorizes educational video titles. Respond only with the category name."
+TITLE_PROMPT_PREFIX = f"""Classify the following video title into exactly ONE of these categories:
+
+{CATEGORIES_BLOCK}
+
+Respond with ONLY the category name, nothing else.
+
+Video title: """
+
+SUMMARY_SYSTEM_MSG = "You are a classifier that categorizes educational content summaries. Respond only with the category name."
+SUMMARY_PROMPT_PREFIX = f"""Classify the following chapter summary into exactly ONE of these categories:
+
+{CATEGORIES_BLOCK}
+
+Respond with ONLY the category name, nothing else.
+
+Summary: """
+
+BATCH_TITLE_SYSTEM_MSG = "You are a classifier that categorizes educational video titles. Respond only with JSON."
+BATCH_TITLE_PROMPT_PREFIX = f"""Classify each of the following video titles into exactly ONE of these categories:
+
+{CATEGORIES_BLOCK}
+
+Respond with a JSON object mapping each title number to its category name, e.g. {{"1": "Problem Solving", "2": "Memory & Recall"}}.
+
+Video titles:
+"""
+
+BATCH_SUMMARY_SYSTEM_MSG = "You are a classifier that categorizes educational content summaries. Respond only with JSON."
+BATCH_SUMMARY_PROMPT_PREFIX = f"""Classify each of the following chapter summaries into exactly ONE of these categories:
+
+{CATEGORIES_BLOCK}
+
+Respond with a JSON object mapping each summary number to its category name, e.g. {{"1": "Problem Solving", "2": "Memory & Recall"}}.
+
+Summaries:
+"""
+
+# Maximum number of classification requests in flight at once
+MAX_CONCURRENT_REQUESTS = 16
+
+# Proactive throttle so bursts stay under the per-minute quota
+REQUESTS_PER_MINUTE = 500
+rate_limiter = AsyncLimiter(REQUESTS_PER_MINUTE, 60)
+
+# Number of texts classified per request
+BATCH_SIZE = 20
+
+# Persistent cache of past classifications, so reruns skip the API
+MOOD_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mood_cache.sqlite")
+CACHE_COMMIT_INTERVAL = 50
+
+# Threads used to read and write the JSON files
+IO_WORKERS = 16
+
+
+class MoodCache:
     """
-    Send text to OpenAI and get a mood classification.
-    text_type can be "title" or "summary"
+    SQLite-backed cache mapping sha256(text_type|text) to a mood.
     """
-    categories_list = "\n".join(f"- {cat}" for cat in CATEGORIES)
-    
-    if text_type == "summary":
-        prompt = f"""Classify the following chapter summary into exactly ONE of these categories:
 
-{categories_list}
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS mood_cache (h TEXT PRIMARY KEY, mood TEXT)")
+        self.uncommitted = 0
 
-Summary: "{text}"
+    @staticmethod
+    def key(text: str, text_type: str) -> str:
+        return hashlib.sha256(f"{text_type}|{text}".encode()).hexdigest()
 
-Respond with ONLY the category name, nothing else."""
-        system_msg = "You are a classifier that categorizes educational content summaries. Respond only with the category name."
-    else:
-        prompt = f"""Classify the following video title into exactly ONE of these categories:
+    def get(self, text: str, text_type: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT mood FROM mood_cache WHERE h = ?", (self.key(text, text_type),)
+        ).fetchone()
+        return row[0] if row else None
 
-{categories_list}
+    def set(self, text: str, text_type: str, mood: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO mood_cache (h, mood) VALUES (?, ?)",
+            (self.key(text, text_type), mood),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= CACHE_COMMIT_INTERVAL:
+            self.conn.commit()
+            self.uncommitted = 0
 
-Video title: "{text}"
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
 
-Respond with ONLY the category name, nothing else."""
-        system_msg = "You are a classifier that categorizes educational video titles. Respond only with the category name."
 
-    response = client.chat.completions.create(
+def wait_retry_after(fallback):
+    """
+    Tenacity wait strategy that honours the server's Retry-After header,
+    falling back to the given strategy when the header is absent.
+    """
+    def wait(retry_state) -> float:
+        response = getattr(retry_state.outcome.exception(), "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return fallback(retry_state)
+    return wait
+
+
+@retry(
+    wait=wait_retry_after(wait_exponential_jitter(initial=1, max=60)),
+    stop=stop_after_attempt(8),
+    retry=retry_if_exception_type((RateLimitError, InternalServerError)),
+)
+async def create_completion(client: AsyncOpenAI, **kwargs):
+    """
+    Throttled chat completion call.
+    Retries with exponential backoff on rate limits and server errors.
+    """
+    async with rate_limiter:
+        return await client.chat.completions.create(**kwargs)
+
+
+async def classify_text_async(client: AsyncOpenAI, text: str, text_type: str = "title") -> str:
+    """
+    Send text to OpenAI and get a mood classification.
+    text_type can be "title" or "summary"
+    """
+    if text_type == "summary":
+        prompt = f'{SUMMARY_PROMPT_PREFIX}"{text}"'
+        system_msg = SUMMARY_SYSTEM_MSG
+    else:
+        prompt = f'{TITLE_PROMPT_PREFIX}"{text}"'
+        system_msg = TITLE_SYSTEM_MSG
+
+    response = await create_completion(
+        client,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": system_msg},
@@ -69,25 +187,70 @@ Respond with ONLY the category name, nothing else."""
     return response.choices[0].message.content.strip()
 
 
-def process_json_files(folder_path: str, classify_by: str = "title"):
+async def classify_batch(client: AsyncOpenAI, texts: list[str], text_type: str = "title") -> list[str]:
+    """
+    Classify several texts with a single OpenAI request.
+    Returns one category per text, in input order. Items the model skips or
+    labels with an unknown category are re-classified individually.
+    """
+    numbered_items = "\n".join(f'{i}. "{text}"' for i, text in enumerate(texts, 1))
+    
+    if text_type == "summary":
+        prompt = BATCH_SUMMARY_PROMPT_PREFIX + numbered_items
+        system_msg = BATCH_SUMMARY_SYSTEM_MSG
+    else:
+        prompt = BATCH_TITLE_PROMPT_PREFIX + numbered_items
+        system_msg = BATCH_TITLE_SYSTEM_MSG
+
+    response = await create_completion(
+        client,
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": system_msg},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0,
+        response_format={"type": "json_object"}
+    )
+    
+    try:
+        parsed = json.loads(response.choices[0].message.content)
+    except json.JSONDecodeError:
+        parsed = {}
+    
+    moods = []
+    for i, text in enumerate(texts, 1):
+        mood = str(parsed.get(str(i), "")).strip()
+        if mood not in CATEGORIES:
+            mood = await classify_text_async(client, text, text_type)
+        moods.append(mood)
+    return moods
+
+
+async def process_json_files_async(folder_path: str, classify_by: str = "title"):
     """
     Process all JSON files in the folder and add mood classification.
+    Texts are classified in batches of BATCH_SIZE, with up to
+    MAX_CONCURRENT_REQUESTS batches in flight.
     classify_by: "title" for video titles, "summary" for chapter summaries
     """
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
     
     # Get all JSON files (exclude _summary.json)
-    json_files = [f for f in glob.glob(os.path.join(folder_path, "*.json")) 
-                  if not f.endswith("_summary.json")]
+    json_files = [entry.path for entry in os.scandir(folder_path)
+                  if entry.is_file() and entry.name.endswith(".json")
+                  and not entry.name.endswith("_summary.json")]
     
     print(f"Found {len(json_files)} JSON files to process")
     print(f"Classifying by: {classify_by}")
     
-    for json_file in json_files:
+    def read_file(json_file: str) -> Optional[tuple]:
+        """Load one file; returns a pending item if it still needs a mood."""
         try:
             # Read the JSON file
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(json_file, 'rb') as f:
+                data = orjson.loads(f.read())
             
             # Get identifier for logging
             if classify_by == "summary":
@@ -100,31 +263,82 @@ def process_json_files(folder_path: str, classify_by: str = "title"):
             # Skip if already has mood
             if 'mood' in data:
                 print(f"Skipping {identifier} - already has mood: {data['mood']}")
-                continue
+                return None
             
             if not text_to_classify:
                 print(f"Skipping {identifier} - no {classify_by} found")
-                continue
+                return None
             
-            # Classify the text
-            print(f"Classifying: {text_to_classify[:60]}...")
-            mood = classify_text(client, text_to_classify, classify_by)
+            return (json_file, data, identifier, text_to_classify)
             
-            # Add mood to data
+        except Exception as e:
+            print(f"Error processing {json_file}: {e}")
+            return None
+    
+    def write_mood(json_file: str, data: dict, identifier: str, mood: str):
+        try:
+            # Add mood to data and write back to file
             data['mood'] = mood
-            
-            # Write back to file
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            print(f"  -> Mood: {mood}")
-            
+            with open(json_file, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+            print(f"  -> {identifier} mood: {mood}")
         except Exception as e:
             print(f"Error processing {json_file}: {e}")
     
+    loop = asyncio.get_running_loop()
+    io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS)
+    
+    # Collect files that still need a mood, reading them in parallel
+    pending = [item for item in io_pool.map(read_file, json_files) if item]
+    
+    cache = MoodCache(MOOD_CACHE_PATH)
+    try:
+        # Reuse moods classified on previous runs
+        uncached = []
+        cached = []
+        for json_file, data, identifier, text in pending:
+            mood = cache.get(text, classify_by)
+            if mood:
+                cached.append((json_file, data, identifier, mood))
+            else:
+                uncached.append((json_file, data, identifier, text))
+        list(io_pool.map(lambda item: write_mood(*item), cached))
+        
+        batches = [uncached[i:i + BATCH_SIZE] for i in range(0, len(uncached), BATCH_SIZE)]
+        print(f"{len(pending) - len(uncached)} moods from cache; "
+              f"classifying {len(uncached)} files in {len(batches)} batches")
+        
+        async def classify_one_batch(batch: list[tuple]):
+            try:
+                async with semaphore:
+                    moods = await classify_batch(client, [item[3] for item in batch], classify_by)
+            except Exception as e:
+                print(f"Error classifying batch starting at {batch[0][0]}: {e}")
+                return
+            
+            # The cache stays on the event loop thread; file writes go to the pool
+            writes = []
+            for (json_file, data, identifier, text), mood in zip(batch, moods):
+                cache.set(text, classify_by, mood)
+                writes.append(loop.run_in_executor(io_pool, write_mood, json_file, data, identifier, mood))
+            await asyncio.gather(*writes)
+        
+        await asyncio.gather(*(classify_one_batch(batch) for batch in batches))
+    finally:
+        cache.close()
+        io_pool.shutdown()
+    
     print("\nDone processing all files!")
 
 
+def process_json_files(folder_path: str, classify_by: str = "title"):
+    """
+    Process all JSON files in the folder and add mood classification.
+    classify_by: "title" for video titles, "summary" for chapter summaries
+    """
+    asyncio.run(process_json_files_async(folder_path, classify_by))
+
+
 if __name__ == "__main__":
     # Default to generated_questions folder with title classification
     if len(sys.argv) >= 2:
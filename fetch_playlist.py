@@ -1,35 +1,102 @@
 #!/usr/bin/env python3
 """
 Script to fetch transcripts from a YouTube playlist.
-Usage: python fetch_playlist.py <playlist_url> [max_videos]
+Usage: python fetch_playlist.py <playlist_url> [max_videos] [start_index] [workers]
 """
 
 import sys
 # Force unbuffered output
 sys.stdout.reconfigure(line_buffering=True)
 
-import json
 import re
 import time
-import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.cookiejar import MozillaCookieJar
 from pathlib import Path
+from typing import Optional
 
+import requests
 import yt_dlp
-from youtube_transcript_api import YouTubeTranscriptApi
+from requests.adapters import HTTPAdapter
+from youtube_transcript_api import NoTranscriptFound, TranscriptsDisabled, VideoUnavailable, YouTubeTranscriptApi
 
-# Initialize the transcript API with optional cookie support
+from output_utils import append_summary_entry, atomic_write_json, load_summary, migrate_legacy_summary
+
+# Transcript API cookies are optional
 COOKIES_FILE = Path(__file__).parent / "cookies.txt"
 if COOKIES_FILE.exists():
-    from http.cookiejar import MozillaCookieJar
-    cookie_jar = MozillaCookieJar(str(COOKIES_FILE))
-    cookie_jar.load()
-    transcript_api = YouTubeTranscriptApi(cookie_jar=cookie_jar)
     print(f"✓ Using cookies from {COOKIES_FILE}", flush=True)
 else:
-    transcript_api = YouTubeTranscriptApi()
     print("⚠ No cookies.txt found - YouTube may block requests.", flush=True)
 
+# YouTubeTranscriptApi and its requests.Session aren't thread-safe, so each
+# worker thread builds its own and keeps reusing its connection
+transcript_local = threading.local()
+
+
+def get_transcript_api() -> YouTubeTranscriptApi:
+    """
+    Return this worker thread's YouTubeTranscriptApi, creating it on first use.
+    """
+    api = getattr(transcript_local, "api", None)
+    if api is None:
+        session = requests.Session()
+        # One request at a time per thread, so one kept-alive connection
+        # per host is all the pool needs; mounted before the API wraps it
+        session.mount("https://", HTTPAdapter(pool_maxsize=1))
+        if COOKIES_FILE.exists():
+            cookie_jar = MozillaCookieJar(str(COOKIES_FILE))
+            cookie_jar.load()
+            session.cookies = cookie_jar
+        api = transcript_local.api = YouTubeTranscriptApi(http_client=session)
+    return api
+
+
+# Parallel transcript fetches, throttled to stay under YouTube rate limits
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 6
+
+# Thread-safe print lock
+print_lock = threading.Lock()
+
+def safe_print(msg):
+    with print_lock:
+        print(msg, flush=True)
+
+
+# Characters stripped from titles when building output filenames
+_SANITIZE = re.compile(r'[^\w\s-]')
+
+def safe_title(title: str) -> str:
+    """
+    Filesystem-safe form of a video title, cut to 50 characters.
+    """
+    return _SANITIZE.sub('', title)[:50].strip()
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces calls at least 1/rate seconds apart.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
 
 def get_playlist_videos(playlist_url: str, max_videos: int = None) -> list[dict]:
     """
@@ -56,13 +123,15 @@ def get_playlist_videos(playlist_url: str, max_videos: int = None) -> list[dict]
     for entry in result.get("entries", []):
         if entry is None:
             continue
+        # Look up the id once and reuse it for the URL and thumbnail
+        video_id = entry.get("id")
         videos.append({
-            "video_id": entry.get("id"),
+            "video_id": video_id,
             "title": entry.get("title", "Unknown Title"),
-            "url": f"https://www.youtube.com/watch?v={entry.get('id')}",
+            "url": f"https://www.youtube.com/watch?v={video_id}",
             "duration": entry.get("duration"),
             "channel": entry.get("channel") or entry.get("uploader"),
-            "thumbnail": entry.get("thumbnail") or f"https://i.ytimg.com/vi/{entry.get('id')}/maxresdefault.jpg",
+            "thumbnail": entry.get("thumbnail") or f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg",
         })
 
     return videos
@@ -74,34 +143,82 @@ def get_video_transcript(video_id: str) -> dict:
     Returns dict with transcript data or error information.
     """
     try:
-        result = transcript_api.fetch(video_id)
-        transcript_list = [
-            {
-                "text": item.text,
-                "start": item.start,
-                "duration": item.duration,
-            }
-            for item in result
-        ]
+        rate_limiter.wait()
+        result = get_transcript_api().fetch(video_id)
+        # Already a list of {"text", "start", "duration"} dicts
         return {
             "success": True,
-            "transcript": transcript_list,
+            "transcript": result.to_raw_data(),
         }
+    except TranscriptsDisabled:
+        error_message = "Transcripts are disabled for this video"
+    except NoTranscriptFound:
+        error_message = "No transcript found for this video"
+    except VideoUnavailable:
+        error_message = "Video is unavailable"
     except Exception as e:
         error_message = str(e)
-        if "disabled" in error_message.lower():
-            error_message = "Transcripts are disabled for this video"
-        elif "no transcript" in error_message.lower():
-            error_message = "No transcript found for this video"
-        elif "unavailable" in error_message.lower():
-            error_message = "Video is unavailable"
-        return {
-            "success": False,
-            "error": error_message,
-        }
+    return {
+        "success": False,
+        "error": error_message,
+    }
+
+
+def process_one(video: dict, file_index: int, total: int, output_path: Path, playlist_url: str) -> Optional[dict]:
+    """
+    Fetch the transcript for one video and save it to its JSON file.
+    Returns the summary entry, or None if the file already exists.
+    """
+    video_id = video["video_id"]
+    
+    # Create safe filename
+    filename = f"{file_index:03d}_{safe_title(video['title'])}_{video_id}.json"
+    filepath = output_path / filename
+    
+    # Skip if file already exists
+    if filepath.exists():
+        safe_print(f"[{file_index}/{total}] Skipping (exists): {video['title'][:50]}")
+        return None
+    
+    safe_print(f"[{file_index}/{total}] Fetching: {video['title'][:50]}...")
+    
+    # Get transcript
+    transcript_result = get_video_transcript(video_id)
+    
+    # Prepare JSON data
+    video_data = {
+        "video_id": video_id,
+        "title": video["title"],
+        "url": video["url"],
+        "channel": video.get("channel"),
+        "thumbnail": video.get("thumbnail"),
+        "duration": video.get("duration"),
+        "playlist_url": playlist_url,
+        "transcript_available": transcript_result["success"],
+    }
+    
+    if transcript_result["success"]:
+        video_data["transcript"] = transcript_result["transcript"]
+        safe_print(f"    [{video_id}] ✓ Success - {len(transcript_result['transcript'])} segments")
+    else:
+        video_data["error"] = transcript_result["error"]
+        safe_print(f"    [{video_id}] ✗ Failed: {transcript_result['error']}")
+    
+    # Save JSON file (each worker writes a distinct file)
+    atomic_write_json(filepath, video_data)
+    
+    entry = {
+        "video_id": video_id,
+        "title": video["title"],
+        "filename": filename,
+        "success": transcript_result["success"],
+    }
+    append_summary_entry(output_path, entry)
+    return entry
 
 
-def fetch_playlist_transcripts(playlist_url: str, output_dir: str, max_videos: int = 100, start_index: int = 1):
+def fetch_playlist_transcripts(playlist_url: str, output_dir: str, max_videos: int = 100, start_index: int = 1,
+                               max_workers: int = MAX_WORKERS):
     """
     Fetch transcripts for videos in a playlist and save to individual JSON files.
     
@@ -110,109 +227,68 @@ def fetch_playlist_transcripts(playlist_url: str, output_dir: str, max_videos: i
         output_dir: Directory to save transcript files
         max_videos: Maximum number of videos to process
         start_index: Starting file number (for continuing from previous runs)
+        max_workers: Number of transcripts fetched in parallel
     """
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
     # Get playlist videos
     videos = get_playlist_videos(playlist_url, max_videos)
+    total = start_index + len(videos) - 1
     print(f"Found {len(videos)} videos to process", flush=True)
     
+    # Per-video records are appended to _summary.jsonl as they finish
+    migrate_legacy_summary(output_path)
+    
     results_summary = {
-        "total_videos": len(videos),
         "successful": 0,
         "failed": 0,
-        "videos": [],
     }
     
-    for i, video in enumerate(videos):
-        video_id = video["video_id"]
-        file_index = start_index + i
-        
-        if not video_id:
-            continue
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for i, video in enumerate(videos):
+            if not video["video_id"]:
+                continue
+            future = executor.submit(process_one, video, start_index + i, total, output_path, playlist_url)
+            futures[future] = video
         
-        # Create safe filename
-        safe_title = re.sub(r'[^\w\s-]', '', video["title"])[:50].strip()
-        filename = f"{file_index:03d}_{safe_title}_{video_id}.json"
-        filepath = output_path / filename
-        
-        # Skip if file already exists
-        if filepath.exists():
-            print(f"[{file_index}/{start_index + len(videos) - 1}] Skipping (exists): {video['title'][:50]}")
-            continue
-        
-        print(f"[{file_index}/{start_index + len(videos) - 1}] Fetching: {video['title'][:50]}...")
-        
-        # Delay between requests to avoid rate limiting
-        if i > 0:
-            time.sleep(1.5)
-        
-        # Get transcript
-        transcript_result = get_video_transcript(video_id)
-        
-        # Prepare JSON data
-        video_data = {
-            "video_id": video_id,
-            "title": video["title"],
-            "url": video["url"],
-            "channel": video.get("channel"),
-            "thumbnail": video.get("thumbnail"),
-            "duration": video.get("duration"),
-            "playlist_url": playlist_url,
-            "transcript_available": transcript_result["success"],
-        }
-        
-        if transcript_result["success"]:
-            video_data["transcript"] = transcript_result["transcript"]
-            results_summary["successful"] += 1
-            print(f"    ✓ Success - {len(transcript_result['transcript'])} segments")
-        else:
-            video_data["error"] = transcript_result["error"]
-            results_summary["failed"] += 1
-            print(f"    ✗ Failed: {transcript_result['error']}")
-        
-        results_summary["videos"].append({
-            "video_id": video_id,
-            "title": video["title"],
-            "filename": filename,
-            "success": transcript_result["success"],
-        })
-        
-        # Save JSON file
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(video_data, f, indent=2, ensure_ascii=False)
-    
-    # Update summary file
-    summary_path = output_path / "_summary.json"
-    if summary_path.exists():
-        with open(summary_path, 'r', encoding='utf-8') as f:
-            existing_summary = json.load(f)
-        # Merge summaries
-        results_summary["total_videos"] += existing_summary.get("total_videos", 0)
-        results_summary["successful"] += existing_summary.get("successful", 0)
-        results_summary["failed"] += existing_summary.get("failed", 0)
-        results_summary["videos"] = existing_summary.get("videos", []) + results_summary["videos"]
-    
-    with open(summary_path, 'w', encoding='utf-8') as f:
-        json.dump(results_summary, f, indent=2, ensure_ascii=False)
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                safe_print(f"    [{video['video_id']}] ✗ Exception: {e}")
+                continue
+            if entry is None:
+                continue
+            if entry["success"]:
+                results_summary["successful"] += 1
+            else:
+                results_summary["failed"] += 1
+    
+    # Snapshot the counters; per-video records live in _summary.jsonl
+    summary = load_summary(output_path)
+    atomic_write_json(output_path / "_summary.json", summary)
     
     print(f"\n{'='*60}")
     print(f"Completed! Saved to: {output_path}")
     print(f"Successful: {results_summary['successful']}")
     print(f"Failed: {results_summary['failed']}")
+    print(f"All runs: {summary['successful']}/{summary['total_videos']} videos with transcripts")
     print(f"{'='*60}")
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python fetch_playlist.py <playlist_url> [max_videos] [start_index]")
+        print("Usage: python fetch_playlist.py <playlist_url> [max_videos] [start_index] [workers]")
         sys.exit(1)
     
     playlist_url = sys.argv[1]
     max_videos = int(sys.argv[2]) if len(sys.argv) > 2 else 100
     start_index = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    max_workers = int(sys.argv[4]) if len(sys.argv) > 4 else MAX_WORKERS
     
     output_dir = Path(__file__).parent / "huberman_transcripts"
     
-    fetch_playlist_transcripts(playlist_url, str(output_dir), max_videos, start_index)
+    fetch_playlist_transcripts(playlist_url, str(output_dir), max_videos, start_index, max_workers)
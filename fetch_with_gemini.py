@@ -3,26 +3,31 @@
 Fetch YouTube playlist and generate quiz questions using Gemini 3 Flash.
 Audio → Questions in one step, with parallel processing.
 
-Usage: python fetch_with_gemini.py <playlist_url> [max_videos] [workers]
+Usage: python fetch_with_gemini.py <playlist_url> [max_videos] [download_workers] [gemini_workers]
 """
 
 import sys
 sys.stdout.reconfigure(line_buffering=True)
 
-import json
+import asyncio
+import hashlib
 import re
 import os
-import tempfile
+import subprocess
 import time
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import threading
 
+import orjson
 import yt_dlp
+from aiolimiter import AsyncLimiter
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 from dotenv import load_dotenv
+from pydantic import BaseModel
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 
 # Load environment variables
 load_dotenv()
@@ -30,6 +35,22 @@ load_dotenv()
 # Initialize Gemini client
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Pipeline stage sizes: parallel audio downloads, and Gemini requests in flight
+DOWNLOAD_WORKERS = 4
+GEMINI_CONCURRENCY = 32
+
+# FFmpeg transcodes in flight; each runs in its own process, one per core
+TRANSCODE_WORKERS = os.cpu_count() or 1
+
+# Proactive throttle so bursts stay under the per-minute quota
+GEMINI_REQUESTS_PER_MINUTE = 60
+gemini_rate_limiter = AsyncLimiter(GEMINI_REQUESTS_PER_MINUTE, 60)
+
+# How far a legacy MP3's probed duration may be from the video's length
+# (seconds, or a fraction of it, whichever is larger) and still be trusted
+LEGACY_DURATION_TOLERANCE_SECONDS = 5
+LEGACY_DURATION_TOLERANCE_FRACTION = 0.02
+
 # Thread-safe print lock
 print_lock = threading.Lock()
 
@@ -38,6 +59,16 @@ def safe_print(msg):
         print(msg, flush=True)
 
 
+# Characters stripped from titles when building output filenames
+_SANITIZE = re.compile(r'[^\w\s-]')
+
+def safe_title(title: str) -> str:
+    """
+    Filesystem-safe form of a video title, cut to 50 characters.
+    """
+    return _SANITIZE.sub('', title)[:50].strip()
+
+
 QUESTION_PROMPT = """You are creating quiz questions for an educational RPG game based on this podcast audio.
 
 Listen carefully to the entire podcast and generate EXACTLY 3 high-quality quiz questions.
@@ -128,6 +159,28 @@ Output ONLY valid JSON in this exact format:
 }"""
 
 
+class QuestionOption(BaseModel):
+    id: str
+    text: str
+    correct: bool
+
+
+class Question(BaseModel):
+    id: int
+    type: str
+    difficulty: str
+    question: str
+    options: list[QuestionOption]
+    explanation: str
+
+
+class QuestionsOutput(BaseModel):
+    """Response schema Gemini is constrained to, matching QUESTION_PROMPT's format."""
+    summary: str
+    key_takeaways: list[str]
+    questions: list[Question]
+
+
 def get_playlist_videos(playlist_url: str, max_videos: int = None) -> list[dict]:
     """
     Use yt-dlp to extract video information from a playlist.
@@ -165,79 +218,211 @@ def get_playlist_videos(playlist_url: str, max_videos: int = None) -> list[dict]
     return videos
 
 
-def download_audio(video_url: str, audio_dir: str, video_id: str) -> Optional[str]:
+# Per-thread YoutubeDL instances, reused across downloads in the same worker
+ydl_local = threading.local()
+
+
+def get_downloader(audio_dir: str) -> yt_dlp.YoutubeDL:
     """
-    Download audio from a YouTube video using yt-dlp.
-    Returns the path to the downloaded file.
-    Skips download if file already exists.
+    Return this worker thread's YoutubeDL for audio_dir, creating it on first use.
+    Building a YoutubeDL loads every extractor, so it is done once per thread.
     """
-    output_path = os.path.join(audio_dir, video_id)
-    mp3_path = output_path + ".mp3"
-    
-    # Skip if already downloaded
-    if os.path.exists(mp3_path):
-        safe_print(f"    [{video_id}] Audio already exists, skipping download")
-        return mp3_path
-    
-    # Download to temp file first
-    temp_output = os.path.join(audio_dir, f"{video_id}_temp")
-    
-    ydl_opts = {
-        # Prefer non-DASH formats to avoid fragmented downloads that stall
-        "format": "worstaudio[protocol!=m3u8][protocol!=m3u8_native][protocol!=dash]/worstaudio/worst",
-        "postprocessors": [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "64",
-        }],
-        "outtmpl": temp_output,
-        "quiet": False,
-        "no_warnings": True,
-        "retries": 5,
-        "fragment_retries": 3,
-        "socket_timeout": 15,  # Shorter timeout to fail faster on stuck downloads
-        "extractor_retries": 3,
+    if getattr(ydl_local, "audio_dir", None) != audio_dir:
+        ydl_local.ydl = yt_dlp.YoutubeDL({
+            # Prefer non-DASH formats to avoid fragmented downloads that stall
+            "format": "worstaudio[protocol!=m3u8][protocol!=m3u8_native][protocol!=dash]/worstaudio/worst",
+            # Save the native stream as {id}_temp.*; transcode_audio makes the MP3
+            "outtmpl": os.path.join(audio_dir, "%(id)s_temp.%(ext)s"),
+            "quiet": False,
+            "no_warnings": True,
+            "retries": 5,
+            "fragment_retries": 3,
+            "socket_timeout": 15,  # Shorter timeout to fail faster on stuck downloads
+            "extractor_retries": 3,
+            # Parallel fragments when only a fragmented format is available
+            "concurrent_fragment_downloads": 4,
+            "http_chunk_size": 10_485_760,
+        })
+        ydl_local.audio_dir = audio_dir
+    return ydl_local.ydl
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hex sha256 of a file, read in 1MB chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fsync_file(path: str):
+    """
+    Flush a finished file to disk so a crash can't leave it truncated.
+    """
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def write_audio_meta(meta_path: str, mp3_path: str):
+    """
+    Record the hash and size of a completed MP3 in its .meta.json sidecar.
+    """
+    meta = {
+        "sha256": file_sha256(mp3_path),
+        "bytes": os.path.getsize(mp3_path),
     }
-    
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(meta))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, meta_path)
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """
+    Duration of an audio file in seconds via ffprobe, or None if it can't
+    be read.
+    """
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
-        
-        # Compress with FFmpeg to mono 16kHz 32kbps
-        temp_mp3 = temp_output + ".mp3"
-        if os.path.exists(temp_mp3):
-            import subprocess
-            subprocess.run([
-                "ffmpeg", "-y", "-i", temp_mp3,
-                "-ac", "1", "-ar", "16000", "-b:a", "32k",
-                mp3_path
-            ], capture_output=True)
-            os.remove(temp_mp3)  # Delete temp file
+        output = subprocess.run([
+            "ffprobe", "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", path
+        ], capture_output=True, text=True, check=True).stdout
+        return float(output.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def audio_is_complete(mp3_path: str, meta_path: str, expected_duration: Optional[float] = None) -> bool:
+    """
+    True if the MP3 matches the hash recorded when it was finished.
+    MP3s from before sidecars existed are adopted only if their probed
+    duration matches the video's expected_duration; ffprobe estimates a
+    duration even for truncated files, so being readable isn't enough.
+    Adopted files get a sidecar so later runs just hash them.
+    """
+    if not os.path.exists(mp3_path):
+        return False
+    if not os.path.exists(meta_path):
+        if not expected_duration:
+            return False
+        duration = probe_duration(mp3_path)
+        tolerance = max(LEGACY_DURATION_TOLERANCE_SECONDS, expected_duration * LEGACY_DURATION_TOLERANCE_FRACTION)
+        if duration is None or abs(duration - expected_duration) > tolerance:
+            return False
+        write_audio_meta(meta_path, mp3_path)
+        return True
+    try:
+        with open(meta_path, 'rb') as f:
+            meta = orjson.loads(f.read())
+        return (
+            os.path.getsize(mp3_path) == meta["bytes"]
+            and file_sha256(mp3_path) == meta["sha256"]
+        )
+    except (OSError, KeyError, TypeError, orjson.JSONDecodeError):
+        return False
+
+
+def download_audio(video_url: str, audio_dir: str) -> Optional[str]:
+    """
+    Download the native audio stream of a YouTube video using yt-dlp.
+    Returns the path to the downloaded (not yet transcoded) file.
+    """
+    try:
+        info = get_downloader(audio_dir).extract_info(video_url, download=True)
+        return info["requested_downloads"][0]["filepath"]
+    except Exception:
+        return None
+
+
+def transcode_audio(temp_path: str, mp3_path: str, meta_path: str) -> Optional[str]:
+    """
+    Turn a downloaded stream into the final MP3 and record its sidecar.
+    The MP3 is only moved into place once complete, and its sha256 is kept
+    in meta_path so later runs can trust it.
+    """
+    try:
+        # Compress with FFmpeg to mono 16kHz 32kbps, into a temp file
+        # that only replaces mp3_path once fully written
+        tmp_mp3_path = mp3_path + ".tmp"
+        transcode = subprocess.run([
+            "ffmpeg", "-y", "-i", temp_path,
+            "-vn", "-ac", "1", "-ar", "16000", "-b:a", "32k",
+            "-f", "mp3", tmp_mp3_path
+        ], capture_output=True)
+        os.remove(temp_path)  # Delete temp file
+        if transcode.returncode != 0:
+            if os.path.exists(tmp_mp3_path):
+                os.remove(tmp_mp3_path)
+            return None
+        fsync_file(tmp_mp3_path)
+        os.replace(tmp_mp3_path, mp3_path)
         
-        return mp3_path if os.path.exists(mp3_path) else None
-    except Exception as e:
+        write_audio_meta(meta_path, mp3_path)
+        return mp3_path
+    except Exception:
         return None
 
 
-def generate_questions_from_audio(audio_path: str, video_title: str) -> dict:
+def is_retryable_gemini_error(e: BaseException) -> bool:
+    """Rate limits (429) and server errors (5xx) are worth retrying."""
+    return isinstance(e, errors.ServerError) or (isinstance(e, errors.ClientError) and e.code == 429)
+
+
+def wait_retry_after(fallback):
+    """
+    Tenacity wait strategy that honours the server's Retry-After header,
+    falling back to the given strategy when the header is absent.
+    """
+    def wait(retry_state) -> float:
+        response = getattr(retry_state.outcome.exception(), "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return fallback(retry_state)
+    return wait
+
+
+@retry(
+    wait=wait_retry_after(wait_exponential_jitter(initial=1, max=60)),
+    stop=stop_after_attempt(8),
+    retry=retry_if_exception(is_retryable_gemini_error),
+)
+async def generate_content(**kwargs):
+    """
+    Throttled Gemini generate_content call.
+    Retries with exponential backoff on rate limits and server errors.
+    """
+    async with gemini_rate_limiter:
+        return await client.aio.models.generate_content(**kwargs)
+
+
+async def generate_questions_from_audio(audio_path: str, video_title: str) -> dict:
     """
     Send audio to Gemini 3 Flash and get quiz questions directly.
+    The audio is streamed from disk via the Files API rather than read into memory.
+    Uses the async client so many generations can be in flight without threads.
     """
+    uploaded = None
     try:
         # Upload the audio file
-        with open(audio_path, "rb") as f:
-            audio_data = f.read()
+        uploaded = await client.aio.files.upload(file=audio_path, config={"mime_type": "audio/mp3"})
         
-        # Create the prompt with context
-        prompt = f"Video Title: {video_title}\n\n{QUESTION_PROMPT}"
+        # Static instructions first so the prompt prefix is identical across calls
+        prompt = f"{QUESTION_PROMPT}\n\nVideo Title: {video_title}"
         
         # Call Gemini with audio
-        response = client.models.generate_content(
+        response = await generate_content(
             model="gemini-2.0-flash",  # Using 2.0 flash as 3.0 may not be available yet
             contents=[
                 types.Content(
                     parts=[
-                        types.Part.from_bytes(data=audio_data, mime_type="audio/mp3"),
+                        types.Part.from_uri(file_uri=uploaded.uri, mime_type="audio/mp3"),
                         types.Part.from_text(text=prompt),
                     ]
                 )
@@ -245,43 +430,50 @@ def generate_questions_from_audio(audio_path: str, video_title: str) -> dict:
             config=types.GenerateContentConfig(
                 temperature=0.7,
                 max_output_tokens=4096,
+                response_mime_type="application/json",
+                response_schema=QuestionsOutput,
             )
         )
         
-        # Parse the JSON response
-        response_text = response.text
-        
-        # Extract JSON from response (handle markdown code blocks)
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
-        
-        questions_data = json.loads(response_text.strip())
+        # Structured output is parsed and validated by the SDK
+        questions_data = response.parsed
+        if questions_data is None:
+            raise ValueError("Gemini response did not match the questions schema")
         
         return {
             "success": True,
-            "summary": questions_data.get("summary", ""),
-            "key_takeaways": questions_data.get("key_takeaways", []),
-            "questions": questions_data.get("questions", []),
+            "summary": questions_data.summary,
+            "key_takeaways": questions_data.key_takeaways,
+            "questions": [question.model_dump() for question in questions_data.questions],
         }
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
         }
+    finally:
+        # Remove the uploaded file from Gemini storage
+        if uploaded is not None:
+            try:
+                await client.aio.files.delete(name=uploaded.name)
+            except Exception:
+                pass
 
 
-def process_video(video: dict, file_index: int, total: int, output_dir: Path, 
-                  questions_dir: Path, audio_dir: str, playlist_url: str) -> dict:
+async def process_video(video: dict, file_index: int, total: int, output_dir: Path, 
+                        questions_dir: Path, audio_dir: str, playlist_url: str,
+                        download_executor: ThreadPoolExecutor, transcode_executor: ThreadPoolExecutor,
+                        gemini_semaphore: asyncio.Semaphore) -> dict:
     """
-    Process a single video: download audio → generate questions with Gemini.
+    Process a single video: download audio → transcode → generate questions with Gemini.
+    Downloads and FFmpeg transcodes run on separate thread pools, so a
+    download worker is free for the next video while FFmpeg runs; the Gemini
+    call runs on the event loop, bounded by gemini_semaphore.
     """
     video_id = video["video_id"]
-    safe_title = re.sub(r'[^\w\s-]', '', video["title"])[:50].strip()
     
     # Check if already processed
-    questions_filename = f"{file_index:03d}_{safe_title}_{video_id}_questions.json"
+    questions_filename = f"{file_index:03d}_{safe_title(video['title'])}_{video_id}_questions.json"
     questions_filepath = questions_dir / questions_filename
     
     if questions_filepath.exists():
@@ -290,9 +482,24 @@ def process_video(video: dict, file_index: int, total: int, output_dir: Path,
     
     safe_print(f"[{file_index}/{total}] Processing: {video['title'][:40]}...")
     
-    # Step 1: Download audio (or use existing)
+    # Step 1: Download audio (or use an existing verified copy)
     safe_print(f"    [{video_id}] Checking audio...")
-    audio_path = download_audio(video["url"], audio_dir, video_id)
+    loop = asyncio.get_running_loop()
+    mp3_path = os.path.join(audio_dir, f"{video_id}.mp3")
+    meta_path = os.path.join(audio_dir, f"{video_id}.meta.json")
+    
+    if await loop.run_in_executor(
+        download_executor, audio_is_complete, mp3_path, meta_path, video.get("duration")
+    ):
+        safe_print(f"    [{video_id}] Audio already exists, skipping download")
+        audio_path = mp3_path
+    else:
+        temp_path = await loop.run_in_executor(download_executor, download_audio, video["url"], audio_dir)
+        audio_path = None
+        if temp_path:
+            audio_path = await loop.run_in_executor(
+                transcode_executor, transcode_audio, temp_path, mp3_path, meta_path
+            )
     
     if not audio_path or not os.path.exists(audio_path):
         safe_print(f"    [{video_id}] ✗ Download failed")
@@ -302,7 +509,8 @@ def process_video(video: dict, file_index: int, total: int, output_dir: Path,
     safe_print(f"    [{video_id}] Audio ready ({file_size_mb:.1f}MB), sending to Gemini...")
     
     # Step 2: Generate questions with Gemini
-    result = generate_questions_from_audio(audio_path, video["title"])
+    async with gemini_semaphore:
+        result = await generate_questions_from_audio(audio_path, video["title"])
     
     # Note: Audio files are kept for potential future regeneration
     
@@ -324,18 +532,41 @@ def process_video(video: dict, file_index: int, total: int, output_dir: Path,
         "questions": result["questions"],
     }
     
-    with open(questions_filepath, 'w', encoding='utf-8') as f:
-        json.dump(questions_data, f, indent=2, ensure_ascii=False)
+    with open(questions_filepath, 'wb') as f:
+        f.write(orjson.dumps(questions_data, option=orjson.OPT_INDENT_2))
     
     safe_print(f"    [{video_id}] ✓ Generated {len(result['questions'])} questions")
     return {"video_id": video_id, "success": True, "questions": len(result["questions"])}
 
 
+async def run_pipeline(videos: list[dict], start_index: int, total: int, output_path: Path,
+                       questions_dir: Path, audio_dir: str, playlist_url: str,
+                       download_workers: int, gemini_concurrency: int) -> list:
+    """
+    Run every video through download → Gemini concurrently.
+    Returns one result (or exception) per video, in playlist order.
+    """
+    gemini_semaphore = asyncio.Semaphore(gemini_concurrency)
+    with ThreadPoolExecutor(max_workers=download_workers) as download_executor, \
+         ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS) as transcode_executor:
+        tasks = [
+            process_video(
+                video, start_index + i, total, output_path, questions_dir,
+                audio_dir, playlist_url, download_executor, transcode_executor,
+                gemini_semaphore
+            )
+            for i, video in enumerate(videos)
+        ]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+
 def fetch_playlist_questions(playlist_url: str, output_dir: str, max_videos: int = 100, 
-                            start_index: int = 1, max_workers: int = 4):
+                            start_index: int = 1, download_workers: int = DOWNLOAD_WORKERS,
+                            gemini_concurrency: int = GEMINI_CONCURRENCY):
     """
     Fetch questions for videos in a playlist using Gemini 3 Flash.
-    Parallelized for speed.
+    Audio downloads use download_workers threads; up to gemini_concurrency
+    Gemini requests run at once on a single event loop.
     """
     output_path = Path(output_dir)
     questions_dir = output_path.parent / "generated_questions"
@@ -345,7 +576,7 @@ def fetch_playlist_questions(playlist_url: str, output_dir: str, max_videos: int
     audio_dir = output_path.parent / "audio_files"
     audio_dir.mkdir(parents=True, exist_ok=True)
     safe_print(f"Audio directory: {audio_dir}")
-    safe_print(f"Using {max_workers} parallel workers")
+    safe_print(f"Using {download_workers} download workers, {gemini_concurrency} concurrent Gemini requests")
     
     # Get playlist videos
     videos = get_playlist_videos(playlist_url, max_videos)
@@ -361,31 +592,21 @@ def fetch_playlist_questions(playlist_url: str, output_dir: str, max_videos: int
     
     start_time = time.time()
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        futures = {}
-        for i, video in enumerate(videos):
-            file_index = start_index + i
-            future = executor.submit(
-                process_video, video, file_index, total,
-                output_path, questions_dir, str(audio_dir), playlist_url
-            )
-            futures[future] = video
-        
-        # Process results as they complete
-        for future in as_completed(futures):
-            video = futures[future]
-            try:
-                result = future.result()
-                if result.get("skipped"):
-                    results["skipped"] += 1
-                elif result["success"]:
-                    results["successful"] += 1
-                else:
-                    results["failed"] += 1
-            except Exception as e:
-                safe_print(f"    [{video['video_id']}] ✗ Exception: {e}")
-                results["failed"] += 1
+    outcomes = asyncio.run(run_pipeline(
+        videos, start_index, total, output_path, questions_dir,
+        str(audio_dir), playlist_url, download_workers, gemini_concurrency
+    ))
+    
+    for video, result in zip(videos, outcomes):
+        if isinstance(result, Exception):
+            safe_print(f"    [{video['video_id']}] ✗ Exception: {result}")
+            results["failed"] += 1
+        elif result.get("skipped"):
+            results["skipped"] += 1
+        elif result["success"]:
+            results["successful"] += 1
+        else:
+            results["failed"] += 1
     
     # Note: Audio files are kept in audio_dir for potential re-processing
     
@@ -401,8 +622,8 @@ def fetch_playlist_questions(playlist_url: str, output_dir: str, max_videos: int
         "elapsed_seconds": elapsed,
     }
     
-    with open(summary_path, 'w', encoding='utf-8') as f:
-        json.dump(summary, f, indent=2, ensure_ascii=False)
+    with open(summary_path, 'wb') as f:
+        f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
     
     safe_print(f"\n{'='*60}")
     safe_print(f"Completed in {elapsed/60:.1f} minutes!")
@@ -415,13 +636,15 @@ def fetch_playlist_questions(playlist_url: str, output_dir: str, max_videos: int
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python fetch_with_gemini.py <playlist_url> [max_videos] [workers]")
+        print("Usage: python fetch_with_gemini.py <playlist_url> [max_videos] [download_workers] [gemini_workers]")
         sys.exit(1)
     
     playlist_url = sys.argv[1]
     max_videos = int(sys.argv[2]) if len(sys.argv) > 2 else 100
-    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    download_workers = int(sys.argv[3]) if len(sys.argv) > 3 else DOWNLOAD_WORKERS
+    gemini_workers = int(sys.argv[4]) if len(sys.argv) > 4 else GEMINI_CONCURRENCY
     
     output_dir = Path(__file__).parent / "huberman_transcripts"
     
-    fetch_playlist_questions(playlist_url, str(output_dir), max_videos, start_index=1, max_workers=max_workers)
+    fetch_playlist_questions(playlist_url, str(output_dir), max_videos, start_index=1,
+                             download_workers=download_workers, gemini_concurrency=gemini_workers)
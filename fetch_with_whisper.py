@@ -3,30 +3,42 @@
 Fetch YouTube playlist transcripts using yt-dlp + OpenAI Whisper API.
 Speeds up audio 2x to reduce transcription costs by 50%.
 
-Usage: python fetch_with_whisper.py <playlist_url> [max_videos] [start_index]
+Usage: python fetch_with_whisper.py <playlist_url> [max_videos] [start_index] [workers]
 """
 
 import sys
 sys.stdout.reconfigure(line_buffering=True)
 
-import json
 import re
-import time
 import os
+import shutil
+import subprocess
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
+from bisect import bisect_right
+from itertools import islice
+from typing import Iterator, Optional
 
+import httpx
+import orjson
 import yt_dlp
-from pydub import AudioSegment
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from output_utils import append_summary_entry, atomic_write_json, load_summary, migrate_legacy_summary
+
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI()
+# Initialize OpenAI client; one pooled HTTP/2 connection set is shared by
+# every Whisper request so TLS sessions are reused across workers
+client = OpenAI(http_client=httpx.Client(
+    http2=True,
+    timeout=httpx.Timeout(600.0, connect=30.0),
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+))
 
 # Speed multiplier (2x = half the cost)
 SPEED_MULTIPLIER = 2.0
@@ -34,86 +46,240 @@ SPEED_MULTIPLIER = 2.0
 # Whisper API file size limit (25MB)
 MAX_FILE_SIZE_MB = 25
 
+# Length of each piece when a file is too large for one request
+# (10 minutes, well under 25MB each)
+CHUNK_SECONDS = 600
+
+# Chunks of one file sent to Whisper concurrently
+CHUNK_WORKERS = 5
+
+# Silence trimming before upload: stretches quieter than SILENCE_NOISE_DB
+# for at least MIN_SILENCE_SECONDS are cut (keeping SPEECH_PADDING seconds
+# either side), but only if that removes MIN_SILENCE_FRACTION of the audio
+SILENCE_NOISE_DB = -35
+MIN_SILENCE_SECONDS = 2.0
+SPEECH_PADDING = 0.25
+MIN_SILENCE_FRACTION = 0.03
+_SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+# Videos processed in parallel; downloads and Whisper requests have their
+# own caps so YouTube and the OpenAI API aren't hit too hard
+MAX_WORKERS = 4
+download_semaphore = threading.Semaphore(2)
+whisper_semaphore = threading.Semaphore(5)
+
+# One YoutubeDL per worker thread, reused across that thread's downloads
+ydl_local = threading.local()
+
+# Redirects followed when resolving a playlist URL to its extractor
+MAX_URL_REDIRECTS = 5
+
+# Thread-safe print lock
+print_lock = threading.Lock()
+
+def safe_print(msg):
+    with print_lock:
+        print(msg, flush=True)
 
-def get_playlist_videos(playlist_url: str, max_videos: int = None) -> list[dict]:
+
+# Characters stripped from titles when building output filenames
+_SANITIZE = re.compile(r'[^\w\s-]')
+
+def safe_title(title: str) -> str:
+    """
+    Filesystem-safe form of a video title, cut to 50 characters.
+    """
+    return _SANITIZE.sub('', title)[:50].strip()
+
+
+def resolve_playlist(ydl: yt_dlp.YoutubeDL, playlist_url: str) -> Optional[dict]:
+    """
+    Extract playlist_url without processing its entries.
+    With process=False yt-dlp returns the raw extractor result, which for
+    playlist?list=, watch?v=...&list= and youtu.be/...?list= URLs is a
+    "url" redirect to the extractor that actually lists the playlist, so
+    follow those until a real result comes back.
+    """
+    result = ydl.extract_info(playlist_url, download=False, process=False)
+    for _ in range(MAX_URL_REDIRECTS):
+        if not result or result.get("_type") not in ("url", "url_transparent"):
+            break
+        result = ydl.extract_info(result["url"], download=False, ie_key=result.get("ie_key"), process=False)
+    return result
+
+
+def get_playlist_videos(playlist_url: str, max_videos: int = None) -> Iterator[dict]:
     """
     Use yt-dlp to extract video information from a playlist.
-    Uses flat extraction for speed (no descriptions).
+    Uses flat extraction for speed (no descriptions), and yields each video
+    as its playlist page arrives instead of waiting for the whole scan.
     """
     ydl_opts = {
         "extract_flat": "in_playlist",
         "quiet": True,
         "no_warnings": True,
     }
-    
-    if max_videos:
-        ydl_opts["playlistend"] = max_videos
 
     print(f"Fetching playlist info...", flush=True)
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        result = ydl.extract_info(playlist_url, download=False)
+        # Unprocessed, "entries" is the extractor's lazy page generator
+        result = resolve_playlist(ydl, playlist_url)
 
-    if not result or "entries" not in result:
-        raise Exception("Could not find videos in playlist")
+        if not result or "entries" not in result:
+            raise Exception("Could not find videos in playlist")
 
-    videos = []
-    for entry in result.get("entries", []):
-        if entry is None:
-            continue
-        video_id = entry.get("id")
-        videos.append({
-            "video_id": video_id,
-            "title": entry.get("title", "Unknown Title"),
-            "url": f"https://www.youtube.com/watch?v={video_id}",
-            "duration": entry.get("duration"),
-            "channel": entry.get("channel") or entry.get("uploader"),
-            "thumbnail": entry.get("thumbnail") or f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg",
-        })
+        entries = (entry for entry in result["entries"] if entry is not None)
+        for entry in islice(entries, max_videos or None):
+            video_id = entry.get("id")
+            yield {
+                "video_id": video_id,
+                "title": entry.get("title", "Unknown Title"),
+                "url": f"https://www.youtube.com/watch?v={video_id}",
+                "duration": entry.get("duration"),
+                "channel": entry.get("channel") or entry.get("uploader"),
+                "thumbnail": entry.get("thumbnail") or f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg",
+            }
 
-    return videos
 
+def get_downloader(audio_dir: str) -> yt_dlp.YoutubeDL:
+    """
+    Return this worker thread's YoutubeDL for audio_dir, creating it on first use.
+    Building a YoutubeDL loads every extractor, so it is done once per thread.
+    """
+    if getattr(ydl_local, "audio_dir", None) != audio_dir:
+        ydl_local.ydl = yt_dlp.YoutubeDL({
+            # Keep the native container (m4a when available) rather than
+            # transcoding to mp3; Whisper and ffmpeg accept it as-is
+            "format": "bestaudio[ext=m4a]/bestaudio",
+            "outtmpl": os.path.join(audio_dir, "%(id)s.%(ext)s"),
+            "postprocessors": [],
+            # Parallel fragments when only a fragmented format is available
+            "concurrent_fragment_downloads": 4,
+            "quiet": True,
+            "no_warnings": True,
+        })
+        ydl_local.audio_dir = audio_dir
+    return ydl_local.ydl
 
-def download_audio(video_url: str, output_path: str) -> Optional[str]:
+
+def download_audio(video_url: str, audio_dir: str) -> Optional[str]:
     """
-    Download audio from a YouTube video using yt-dlp.
+    Download audio from a YouTube video into audio_dir using yt-dlp.
     Returns the path to the downloaded file.
     """
-    ydl_opts = {
-        "format": "bestaudio/best",
-        "postprocessors": [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "128",
-        }],
-        "outtmpl": output_path,
-        "quiet": True,
-        "no_warnings": True,
-    }
-    
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
-        # yt-dlp adds .mp3 extension
-        return output_path + ".mp3"
+        info = get_downloader(audio_dir).extract_info(video_url, download=True)
+        return info["requested_downloads"][0]["filepath"]
     except Exception as e:
-        print(f"    ✗ Download failed: {e}", flush=True)
+        safe_print(f"    ✗ Download failed: {e}")
         return None
 
 
-def speed_up_audio(input_path: str, output_path: str, speed: float = 2.0) -> str:
+def atempo_filter(speed: float) -> str:
+    """
+    Build an ffmpeg atempo filter chain for the given speed.
+    A single atempo stage accepts 0.5-2.0, so larger factors are chained.
+    """
+    stages = []
+    while speed > 2.0:
+        stages.append("atempo=2.0")
+        speed /= 2.0
+    while speed < 0.5:
+        stages.append("atempo=0.5")
+        speed /= 0.5
+    stages.append(f"atempo={speed:g}")
+    return ",".join(stages)
+
+
+def detect_speech_regions(audio_path: str) -> Optional[list[tuple[float, float]]]:
     """
-    Speed up audio file using pydub.
-    Returns path to sped-up audio file.
+    Find the non-silent stretches of a file with ffmpeg's silencedetect.
+    Returns (start, end) pairs in seconds, padded slightly so word edges
+    aren't clipped, or None if there's too little silence to be worth cutting.
     """
-    audio = AudioSegment.from_mp3(input_path)
+    duration = probe_duration(audio_path)
+    output = subprocess.run([
+        "ffmpeg", "-i", audio_path,
+        "-af", f"silencedetect=noise={SILENCE_NOISE_DB}dB:d={MIN_SILENCE_SECONDS}",
+        "-f", "null", "-"
+    ], capture_output=True, check=True, text=True).stderr
+    
+    regions = []
+    speech_start = 0.0
+    in_silence = False
+    for match in _SILENCE_RE.finditer(output):
+        kind, value = match.group(1), float(match.group(2))
+        if kind == "start":
+            if value > speech_start:
+                regions.append((speech_start, value))
+            in_silence = True
+        else:
+            speech_start = value
+            in_silence = False
+    # Trailing speech, unless the file ends in silence
+    if not in_silence and speech_start < duration:
+        regions.append((speech_start, duration))
     
-    # Speed up by changing frame rate then converting back
-    # This method preserves reasonable quality
-    sped_up = audio._spawn(audio.raw_data, overrides={
-        "frame_rate": int(audio.frame_rate * speed)
-    }).set_frame_rate(audio.frame_rate)
+    # Pad each region, merging any that now overlap
+    padded = []
+    for start, end in regions:
+        start, end = max(0.0, start - SPEECH_PADDING), min(duration, end + SPEECH_PADDING)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], max(padded[-1][1], end))
+        else:
+            padded.append((start, end))
+    
+    speech_seconds = sum(end - start for start, end in padded)
+    if not padded or duration - speech_seconds < duration * MIN_SILENCE_FRACTION:
+        return None
+    return padded
+
+
+def remap_transcript(transcript: list[dict], regions: list[tuple[float, float]]) -> list[dict]:
+    """
+    Map segment times from the silence-trimmed audio back onto the original.
+    Each kept region starts at a known offset in the trimmed audio; a time
+    inside it is shifted by that region's original start.
+    """
+    trimmed_starts = []
+    elapsed = 0.0
+    for start, end in regions:
+        trimmed_starts.append(elapsed)
+        elapsed += end - start
+    
+    def to_original(t: float) -> float:
+        i = max(bisect_right(trimmed_starts, t) - 1, 0)
+        return regions[i][0] + (t - trimmed_starts[i])
+    
+    for segment in transcript:
+        start = to_original(segment["start"])
+        end = to_original(segment["start"] + segment["duration"])
+        segment["start"] = start
+        segment["duration"] = end - start
+    return transcript
+
+
+def prepare_audio(input_path: str, output_path: str, speed: float = 2.0,
+                  speech_regions: Optional[list[tuple[float, float]]] = None) -> str:
+    """
+    Convert downloaded audio into the file sent to Whisper in one ffmpeg pass:
+    sped up with the pitch-preserving atempo filter, downmixed to mono 16kHz
+    (what Whisper resamples to anyway) and encoded as 64kbps mp3.
+    If speech_regions is given, everything outside them is cut out first.
+    Returns path to the prepared audio file.
+    """
+    filters = []
+    if speech_regions:
+        keep = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in speech_regions)
+        filters += [f"aselect='{keep}'", "asetpts=N/SR/TB"]
+    filters.append(atempo_filter(speed))
     
-    sped_up.export(output_path, format="mp3")
+    subprocess.run([
+        "ffmpeg", "-y", "-i", input_path,
+        "-vn", "-ac", "1", "-ar", "16000",
+        "-filter:a", ",".join(filters), "-b:a", "64k",
+        "-f", "mp3", output_path
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
     return output_path
 
 
@@ -130,7 +296,7 @@ def transcribe_audio(audio_path: str, speed_multiplier: float = 2.0) -> dict:
             # Need to chunk the audio
             return transcribe_audio_chunked(audio_path, speed_multiplier)
         
-        with open(audio_path, "rb") as audio_file:
+        with open(audio_path, "rb") as audio_file, whisper_semaphore:
             response = client.audio.transcriptions.create(
                 model="whisper-1",
                 file=audio_file,
@@ -138,14 +304,16 @@ def transcribe_audio(audio_path: str, speed_multiplier: float = 2.0) -> dict:
                 timestamp_granularities=["segment"]
             )
         
-        # Convert to our transcript format and adjust timestamps
-        transcript = []
-        for segment in response.segments:
-            transcript.append({
+        # Convert to our transcript format and adjust timestamps for speedup
+        sm = speed_multiplier
+        transcript = [
+            {
                 "text": segment.text.strip(),
-                "start": segment.start * speed_multiplier,  # Adjust for speedup
-                "duration": (segment.end - segment.start) * speed_multiplier,
-            })
+                "start": segment.start * sm,
+                "duration": (segment.end - segment.start) * sm,
+            }
+            for segment in response.segments
+        ]
         
         return {
             "success": True,
@@ -158,58 +326,93 @@ def transcribe_audio(audio_path: str, speed_multiplier: float = 2.0) -> dict:
         }
 
 
+def probe_duration(path: str) -> float:
+    """
+    Duration of an audio file in seconds, read with ffprobe.
+    """
+    output = subprocess.run([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "csv=p=0", path
+    ], capture_output=True, check=True, text=True).stdout
+    return float(output.strip())
+
+
+def split_audio(audio_path: str, chunk_dir: str) -> list[str]:
+    """
+    Cut audio into CHUNK_SECONDS pieces with ffmpeg's segment muxer.
+    Streams are copied, not re-encoded, so no audio is decoded in Python.
+    Returns the chunk paths in playback order.
+    """
+    ext = os.path.splitext(audio_path)[1]
+    subprocess.run([
+        "ffmpeg", "-y", "-i", audio_path,
+        "-f", "segment", "-segment_time", str(CHUNK_SECONDS), "-c", "copy",
+        os.path.join(chunk_dir, f"chunk%03d{ext}")
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return sorted(
+        os.path.join(chunk_dir, name) for name in os.listdir(chunk_dir)
+        if name.startswith("chunk")
+    )
+
+
+def transcribe_chunk(chunk_path: str, time_offset: float, speed_multiplier: float) -> list[dict]:
+    """
+    Transcribe one chunk and shift its segments by the chunk's start offset.
+    """
+    with open(chunk_path, "rb") as audio_file, whisper_semaphore:
+        response = client.audio.transcriptions.create(
+            model="whisper-1",
+            file=audio_file,
+            response_format="verbose_json",
+            timestamp_granularities=["segment"]
+        )
+    
+    # Adjust timestamps for chunk offset and speed
+    sm = speed_multiplier
+    offset_scaled = time_offset * sm
+    return [
+        {
+            "text": segment.text.strip(),
+            "start": offset_scaled + segment.start * sm,
+            "duration": (segment.end - segment.start) * sm,
+        }
+        for segment in response.segments
+    ]
+
+
 def transcribe_audio_chunked(audio_path: str, speed_multiplier: float = 2.0) -> dict:
     """
     Transcribe large audio files by chunking them.
+    Chunks are transcribed concurrently (capped by whisper_semaphore) and
+    reassembled in order.
     """
     try:
-        audio = AudioSegment.from_mp3(audio_path)
-        
-        # Split into 10-minute chunks (should be well under 25MB each)
-        chunk_length_ms = 10 * 60 * 1000  # 10 minutes
-        chunks = []
-        
-        for i in range(0, len(audio), chunk_length_ms):
-            chunks.append(audio[i:i + chunk_length_ms])
-        
-        print(f"    Splitting into {len(chunks)} chunks...", flush=True)
-        
-        full_transcript = []
-        time_offset = 0  # Track cumulative time for timestamp adjustment
-        
-        for i, chunk in enumerate(chunks):
-            # Export chunk to temp file
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
-                chunk.export(tmp.name, format="mp3")
-                tmp_path = tmp.name
+        with tempfile.TemporaryDirectory(prefix="whisper_chunks_") as chunk_dir:
+            chunks = split_audio(audio_path, chunk_dir)
             
-            try:
-                with open(tmp_path, "rb") as audio_file:
-                    response = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        response_format="verbose_json",
-                        timestamp_granularities=["segment"]
-                    )
-                
-                for segment in response.segments:
-                    # Adjust timestamps for chunk offset and speed
-                    adjusted_start = (time_offset + segment.start) * speed_multiplier
-                    adjusted_duration = (segment.end - segment.start) * speed_multiplier
-                    
-                    full_transcript.append({
-                        "text": segment.text.strip(),
-                        "start": adjusted_start,
-                        "duration": adjusted_duration,
-                    })
-                
-            finally:
-                os.unlink(tmp_path)
+            safe_print(f"    Splitting into {len(chunks)} chunks...")
             
-            # Update time offset for next chunk (in sped-up time)
-            time_offset += len(chunk) / 1000  # Convert ms to seconds
+            # Start time of each chunk (in sped-up time); segment cuts land
+            # on packet boundaries, so use the real lengths
+            offsets = []
+            time_offset = 0
+            for chunk_path in chunks:
+                offsets.append(time_offset)
+                time_offset += probe_duration(chunk_path)
             
-            print(f"    Chunk {i+1}/{len(chunks)} transcribed", flush=True)
+            with ThreadPoolExecutor(max_workers=CHUNK_WORKERS) as executor:
+                futures = [
+                    executor.submit(transcribe_chunk, chunk_path, offset, speed_multiplier)
+                    for chunk_path, offset in zip(chunks, offsets)
+                ]
+                chunk_transcripts = []
+                for i, future in enumerate(futures):
+                    chunk_transcripts.append(future.result())
+                    safe_print(f"    Chunk {i+1}/{len(chunks)} transcribed")
+        
+        full_transcript = []
+        for chunk_transcript in chunk_transcripts:
+            full_transcript.extend(chunk_transcript)
         
         return {
             "success": True,
@@ -222,9 +425,132 @@ def transcribe_audio_chunked(audio_path: str, speed_multiplier: float = 2.0) ->
         }
 
 
-def fetch_playlist_transcripts(playlist_url: str, output_dir: str, max_videos: int = 100, start_index: int = 1):
+def process_one(video: dict, file_index: int, output_path: Path,
+                temp_dir: Path, playlist_url: str) -> Optional[dict]:
+    """
+    Download, speed up and transcribe one video, then save its JSON file.
+    Returns the summary entry, or None if a transcript already exists.
+    """
+    video_id = video["video_id"]
+    
+    # Create safe filename
+    filename = f"{file_index:03d}_{safe_title(video['title'])}_{video_id}.json"
+    filepath = output_path / filename
+    
+    # Skip if file already exists with transcript
+    if filepath.exists():
+        try:
+            existing = orjson.loads(filepath.read_bytes())
+            if existing.get("transcript_available") and existing.get("transcript"):
+                safe_print(f"[{file_index}] Skipping (exists): {video['title'][:50]}")
+                return None
+        except:
+            pass
+    
+    safe_print(f"[{file_index}] Processing: {video['title'][:50]}...")
+    
+    # Step 1: Download audio (a few at a time, to stay under YouTube rate limits)
+    with download_semaphore:
+        downloaded_path = download_audio(video["url"], str(temp_dir))
+    
+    def record_failure(error: str) -> dict:
+        """Save a failed-video JSON file and its summary entry."""
+        safe_print(f"    [{video_id}] ✗ {error}")
+        video_data = {
+            "video_id": video_id,
+            "title": video["title"],
+            "url": video["url"],
+            "channel": video.get("channel"),
+            "thumbnail": video.get("thumbnail"),
+            "duration": video.get("duration"),
+            "playlist_url": playlist_url,
+            "transcript_available": False,
+            "error": error,
+        }
+        atomic_write_json(filepath, video_data)
+        entry = {
+            "video_id": video_id,
+            "title": video["title"],
+            "filename": filename,
+            "success": False,
+        }
+        append_summary_entry(output_path, entry)
+        return entry
+    
+    if not downloaded_path or not os.path.exists(downloaded_path):
+        return record_failure("Audio download failed")
+    
+    # Step 2: Cut silence, speed up and downmix audio in a single ffmpeg pass
+    safe_print(f"    [{video_id}] Preparing audio ({SPEED_MULTIPLIER}x, mono 16kHz)...")
+    sped_up_path = str(temp_dir / f"{video_id}_fast.mp3")
+    try:
+        try:
+            speech_regions = detect_speech_regions(downloaded_path)
+        except (subprocess.CalledProcessError, ValueError):
+            # Trimming is only an optimization; send the untrimmed audio,
+            # whose timestamps need no remapping
+            safe_print(f"    [{video_id}] ⚠ Silence detection failed, keeping full audio")
+            speech_regions = None
+        prepare_audio(downloaded_path, sped_up_path, SPEED_MULTIPLIER, speech_regions)
+    except subprocess.CalledProcessError:
+        if os.path.exists(sped_up_path):
+            os.unlink(sped_up_path)
+        return record_failure("Audio preparation failed")
+    finally:
+        os.unlink(downloaded_path)
+    
+    # Step 3: Transcribe
+    safe_print(f"    [{video_id}] Transcribing with Whisper API...")
+    transcript_result = transcribe_audio(sped_up_path, SPEED_MULTIPLIER)
+    
+    # Clean up audio file
+    try:
+        os.unlink(sped_up_path)
+    except:
+        pass
+    
+    # Prepare JSON data
+    video_data = {
+        "video_id": video_id,
+        "title": video["title"],
+        "url": video["url"],
+        "channel": video.get("channel"),
+        "thumbnail": video.get("thumbnail"),
+        "duration": video.get("duration"),
+        "playlist_url": playlist_url,
+        "transcript_available": transcript_result["success"],
+    }
+    
+    if transcript_result["success"] and speech_regions:
+        # Timestamps are relative to the trimmed audio; restore the originals
+        remap_transcript(transcript_result["transcript"], speech_regions)
+    
+    if transcript_result["success"]:
+        video_data["transcript"] = transcript_result["transcript"]
+        safe_print(f"    [{video_id}] ✓ Success - {len(transcript_result['transcript'])} segments")
+    else:
+        video_data["error"] = transcript_result["error"]
+        safe_print(f"    [{video_id}] ✗ Failed: {transcript_result['error']}")
+    
+    # Save JSON file (each worker writes a distinct file)
+    atomic_write_json(filepath, video_data)
+    
+    entry = {
+        "video_id": video_id,
+        "title": video["title"],
+        "filename": filename,
+        "success": transcript_result["success"],
+    }
+    append_summary_entry(output_path, entry)
+    return entry
+
+
+def fetch_playlist_transcripts(playlist_url: str, output_dir: str, max_videos: int = 100, start_index: int = 1,
+                               max_workers: int = MAX_WORKERS):
     """
     Fetch transcripts for videos in a playlist using yt-dlp + Whisper API.
+    Up to max_workers videos are processed at once; downloads and Whisper
+    requests are further limited by their own semaphores.
     """
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
@@ -233,154 +559,69 @@ def fetch_playlist_transcripts(playlist_url: str, output_dir: str, max_videos: i
     temp_dir = Path(tempfile.mkdtemp(prefix="whisper_audio_"))
     print(f"Temp audio directory: {temp_dir}", flush=True)
     
-    # Get playlist videos
-    videos = get_playlist_videos(playlist_url, max_videos)
-    print(f"Found {len(videos)} videos to process", flush=True)
+    # Per-video records are appended to _summary.jsonl as they finish
+    migrate_legacy_summary(output_path)
     
     results_summary = {
-        "total_videos": len(videos),
         "successful": 0,
         "failed": 0,
-        "videos": [],
     }
     
     try:
-        for i, video in enumerate(videos):
-            video_id = video["video_id"]
-            file_index = start_index + i
-            
-            if not video_id:
-                continue
-            
-            # Create safe filename
-            safe_title = re.sub(r'[^\w\s-]', '', video["title"])[:50].strip()
-            filename = f"{file_index:03d}_{safe_title}_{video_id}.json"
-            filepath = output_path / filename
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Start each video as soon as the playlist scan yields it
+            futures = {}
+            for i, video in enumerate(get_playlist_videos(playlist_url, max_videos)):
+                if not video["video_id"]:
+                    continue
+                future = executor.submit(process_one, video, start_index + i, output_path,
+                                         temp_dir, playlist_url)
+                futures[future] = video
+            safe_print(f"Found {len(futures)} videos to process")
             
-            # Skip if file already exists with transcript
-            if filepath.exists():
+            for future in as_completed(futures):
+                video = futures[future]
                 try:
-                    with open(filepath, 'r') as f:
-                        existing = json.load(f)
-                    if existing.get("transcript_available") and existing.get("transcript"):
-                        print(f"[{file_index}/{start_index + len(videos) - 1}] Skipping (exists): {video['title'][:50]}", flush=True)
-                        continue
-                except:
-                    pass
-            
-            print(f"[{file_index}/{start_index + len(videos) - 1}] Processing: {video['title'][:50]}...", flush=True)
-            
-            # Rate limiting for YouTube downloads
-            if i > 0:
-                time.sleep(3)
-            
-            # Step 1: Download audio
-            audio_path = temp_dir / f"{video_id}"
-            downloaded_path = download_audio(video["url"], str(audio_path))
-            
-            if not downloaded_path or not os.path.exists(downloaded_path):
-                print(f"    ✗ Audio download failed", flush=True)
-                video_data = {
-                    "video_id": video_id,
-                    "title": video["title"],
-                    "url": video["url"],
-                    "channel": video.get("channel"),
-                    "thumbnail": video.get("thumbnail"),
-                    "duration": video.get("duration"),
-                    "playlist_url": playlist_url,
-                    "transcript_available": False,
-                    "error": "Audio download failed",
-                }
-                results_summary["failed"] += 1
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(video_data, f, indent=2, ensure_ascii=False)
-                continue
-            
-            # Step 2: Speed up audio
-            print(f"    Speeding up audio {SPEED_MULTIPLIER}x...", flush=True)
-            sped_up_path = str(temp_dir / f"{video_id}_fast.mp3")
-            speed_up_audio(downloaded_path, sped_up_path, SPEED_MULTIPLIER)
-            
-            # Step 3: Transcribe
-            print(f"    Transcribing with Whisper API...", flush=True)
-            transcript_result = transcribe_audio(sped_up_path, SPEED_MULTIPLIER)
-            
-            # Clean up audio files
-            try:
-                os.unlink(downloaded_path)
-                os.unlink(sped_up_path)
-            except:
-                pass
-            
-            # Prepare JSON data
-            video_data = {
-                "video_id": video_id,
-                "title": video["title"],
-                "url": video["url"],
-                "channel": video.get("channel"),
-                "thumbnail": video.get("thumbnail"),
-                "duration": video.get("duration"),
-                "playlist_url": playlist_url,
-                "transcript_available": transcript_result["success"],
-            }
-            
-            if transcript_result["success"]:
-                video_data["transcript"] = transcript_result["transcript"]
-                results_summary["successful"] += 1
-                print(f"    ✓ Success - {len(transcript_result['transcript'])} segments", flush=True)
-            else:
-                video_data["error"] = transcript_result["error"]
-                results_summary["failed"] += 1
-                print(f"    ✗ Failed: {transcript_result['error']}", flush=True)
-            
-            results_summary["videos"].append({
-                "video_id": video_id,
-                "title": video["title"],
-                "filename": filename,
-                "success": transcript_result["success"],
-            })
-            
-            # Save JSON file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(video_data, f, indent=2, ensure_ascii=False)
+                    entry = future.result()
+                except Exception as e:
+                    safe_print(f"    [{video['video_id']}] ✗ Exception: {e}")
+                    continue
+                if entry is None:
+                    continue
+                if entry["success"]:
+                    results_summary["successful"] += 1
+                else:
+                    results_summary["failed"] += 1
     
     finally:
         # Clean up temp directory
         try:
-            import shutil
             shutil.rmtree(temp_dir)
         except:
             pass
     
-    # Update summary file
-    summary_path = output_path / "_summary.json"
-    if summary_path.exists():
-        with open(summary_path, 'r', encoding='utf-8') as f:
-            existing_summary = json.load(f)
-        results_summary["total_videos"] += existing_summary.get("total_videos", 0)
-        results_summary["successful"] += existing_summary.get("successful", 0)
-        results_summary["failed"] += existing_summary.get("failed", 0)
-        results_summary["videos"] = existing_summary.get("videos", []) + results_summary["videos"]
-    
-    with open(summary_path, 'w', encoding='utf-8') as f:
-        json.dump(results_summary, f, indent=2, ensure_ascii=False)
+    # Snapshot the counters; per-video records live in _summary.jsonl
+    summary = load_summary(output_path)
+    atomic_write_json(output_path / "_summary.json", summary)
     
     print(f"\n{'='*60}", flush=True)
     print(f"Completed! Saved to: {output_path}", flush=True)
     print(f"Successful: {results_summary['successful']}", flush=True)
     print(f"Failed: {results_summary['failed']}", flush=True)
+    print(f"All runs: {summary['successful']}/{summary['total_videos']} videos with transcripts", flush=True)
     print(f"{'='*60}", flush=True)
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python fetch_with_whisper.py <playlist_url> [max_videos] [start_index]")
+        print("Usage: python fetch_with_whisper.py <playlist_url> [max_videos] [start_index] [workers]")
         sys.exit(1)
     
     playlist_url = sys.argv[1]
     max_videos = int(sys.argv[2]) if len(sys.argv) > 2 else 100
     start_index = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    max_workers = int(sys.argv[4]) if len(sys.argv) > 4 else MAX_WORKERS
     
     output_dir = Path(__file__).parent / "huberman_transcripts"
     
-    fetch_playlist_transcripts(playlist_url, str(output_dir), max_videos, start_index)
+    fetch_playlist_transcripts(playlist_url, str(output_dir), max_videos, start_index, max_workers)
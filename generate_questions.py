@@ -12,20 +12,44 @@ Environment:
 """
 
 import argparse
+import hashlib
 import json
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+import httpx
+import orjson
+import tiktoken
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from output_utils import atomic_write_json
 from prompts import INSIGHT_EXTRACTION_PROMPT, QUESTION_GENERATION_PROMPT
 
 # Load environment variables from .env file
 load_dotenv()
 
+# On-disk cache of insight and question responses, so reruns skip the API
+INSIGHT_CACHE_DIR = Path(__file__).parent / ".insight_cache"
+
+# Tokenizer used by the gpt-4o model family, for exact transcript truncation
+TOKENIZER_ENCODING = "o200k_base"
+
+# Transcript files processed in parallel (each is two blocking OpenAI calls)
+MAX_WORKERS = 8
+
+# Thread-safe print lock
+print_lock = threading.Lock()
+
+def safe_print(msg):
+    with print_lock:
+        print(msg, flush=True)
+
 
 def get_client() -> OpenAI:
     """Initialize OpenAI client."""
@@ -35,7 +59,49 @@ def get_client() -> OpenAI:
             "OPENAI_API_KEY environment variable not set. "
             "Run: export OPENAI_API_KEY='your-key-here'"
         )
-    return OpenAI(api_key=api_key)
+    # Pooled HTTP/2 connections, shared by all worker threads
+    http_client = httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(600.0, connect=30.0),
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    )
+    return OpenAI(api_key=api_key, http_client=http_client)
+
+
+# Patterns used on every transcript chunk, compiled once. _CLEAN_RE matches
+# either a run of filler words (with the whitespace around them) or a plain
+# whitespace run, so clean_text makes a single pass
+_CLEAN_RE = re.compile(r"(?:\s*\b(?:um|uh|uhm|hmm)\b)+\s*|\s+", re.IGNORECASE)
+_WS_RE = re.compile(r"\s")
+
+# Phrases that mark a sponsor/ad read (matched as whole words)
+SPONSOR_KEYWORDS = [
+    "ag1", "athletic greens", "lmnt", "element", "insidetracker", "eight sleep",
+    "whoop", "our sponsors", "today's sponsor", "sponsored by", "use code",
+    "discount code", "promo code", "drinklmnt", "athleticgreens",
+]
+
+# All sponsor keywords fused into one alternation, so each chunk is
+# scanned once instead of once per keyword
+_SPONSOR_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(kw) for kw in SPONSOR_KEYWORDS) + r")\b",
+    re.IGNORECASE,
+)
+
+# With pyahocorasick installed, sponsor detection uses a keyword automaton
+# (one linear pass in C); otherwise it falls back to _SPONSOR_RE
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+if ahocorasick is not None:
+    _SPONSOR_AC = ahocorasick.Automaton()
+    for kw in SPONSOR_KEYWORDS:
+        _SPONSOR_AC.add_word(kw, kw)
+    _SPONSOR_AC.make_automaton()
+else:
+    _SPONSOR_AC = None
 
 
 def clean_text(text: str) -> str:
@@ -44,55 +110,83 @@ def clean_text(text: str) -> str:
     - Remove filler words (um, uh)
     - Clean up spacing
     """
-    # Remove standalone filler words (with word boundaries)
-    text = re.sub(r'\b(um|uh|uhm|hmm)\b', '', text, flags=re.IGNORECASE)
-    # Clean up any double spaces created
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    # Drop standalone filler words and collapse whitespace in one pass;
+    # a match becomes one space if it spanned any whitespace
+    return _CLEAN_RE.sub(_clean_replacement, text).strip()
+
+
+def _clean_replacement(match: re.Match) -> str:
+    return " " if _WS_RE.search(match.group()) else ""
 
 
 def is_sponsor_segment(text: str) -> bool:
     """
     Detect if text is part of a sponsor/ad segment.
     """
-    sponsor_keywords = [
-        r'\bag1\b', r'\bathletic greens\b', r'\blmnt\b', r'\belement\b',
-        r'\binsidetracker\b', r'\beight sleep\b', r'\bwhoop\b',
-        r'\bour sponsors\b', r'\btoday\'s sponsor\b', r'\bsponsored by\b',
-        r'\buse code\b', r'\bdiscount code\b', r'\bpromo code\b',
-        r'\bdrinklmnt\b', r'\bathleticgreens\b'
-    ]
+    if _SPONSOR_AC is None:
+        return _SPONSOR_RE.search(text) is not None
+    
     text_lower = text.lower()
-    return any(re.search(pattern, text_lower) for pattern in sponsor_keywords)
+    for end, kw in _SPONSOR_AC.iter(text_lower):
+        # Keep the regex's word-boundary semantics (e.g. "element" but not "elements")
+        start = end - len(kw) + 1
+        before_ok = start == 0 or not _is_word_char(text_lower[start - 1])
+        after_ok = end + 1 == len(text_lower) or not _is_word_char(text_lower[end + 1])
+        if before_ok and after_ok:
+            return True
+    return False
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def transcript_columns(transcript) -> tuple[list[str], list[float]]:
+    """
+    Pull caption texts and start times out of a saved transcript.
+    Accepts a list of {"text", "start", "duration"} dicts, or the
+    column-wise {"texts", "starts", "durations"} layout written by the web
+    app. Start times are always returned in seconds.
+    """
+    if isinstance(transcript, dict):
+        starts = transcript["starts"]
+        if transcript.get("units") == "ms":
+            starts = [start / 1000 for start in starts]
+        return transcript["texts"], starts
+    return ([chunk.get("text", "") for chunk in transcript],
+            [chunk.get("start", 0) for chunk in transcript])
 
 
-def merge_transcript_chunks(transcript: list[dict], skip_sponsors: bool = True) -> str:
+def merge_transcript_chunks(texts: list[str], starts: list[float], skip_sponsors: bool = True) -> str:
     """
     Merge fragmented transcript chunks into coherent paragraphs.
     
     The raw transcript has tiny chunks like:
-        {"text": "welcome to the", "start": 0.32}
-        {"text": "huberman Lab podcast", "start": 1.2}
+        "welcome to the" at 0.32s
+        "huberman Lab podcast" at 1.2s
     
     This merges them into readable paragraphs with timestamps.
+    texts and starts are parallel lists, as returned by transcript_columns.
     
     Cleaning applied:
     - Skip [Music] / [Sound] annotations
     - Remove filler words (um, uh)
     - Optionally skip sponsor segments
     """
-    if not transcript:
+    if not texts:
         return ""
     
     merged_text = []
     current_paragraph = []
-    current_start = transcript[0].get("start", 0)
+    current_len = 0  # Length of " ".join(current_paragraph), kept as we go
     skip_until_time = 0  # Used to skip sponsor segments
     
-    for i, chunk in enumerate(transcript):
-        text = chunk.get("text", "").strip()
-        chunk_start = chunk.get("start", 0)
-        
+    # Each chunk is paired with the next chunk's start for the pause check
+    texts = [text.strip() for text in texts]
+    next_starts = starts[1:] + [float("inf")]
+    current_start = starts[0]
+    
+    for text, chunk_start, next_start in zip(texts, starts, next_starts):
         # Skip if we're in a sponsor segment
         if skip_sponsors and chunk_start < skip_until_time:
             continue
@@ -107,43 +201,43 @@ def merge_transcript_chunks(transcript: list[dict], skip_sponsors: bool = True)
             # Flush current paragraph before skipping
             if current_paragraph:
                 timestamp = f"[{int(current_start // 60)}:{int(current_start % 60):02d}]"
-                paragraph_text = clean_text(" ".join(current_paragraph))
+                paragraph_text = " ".join(current_paragraph)
                 if paragraph_text:
                     merged_text.append(f"{timestamp} {paragraph_text}")
                 current_paragraph = []
+                current_len = 0
             continue
         
         # Clean and add text
         cleaned = clean_text(text)
         if cleaned:
+            current_len += len(cleaned) + (1 if current_paragraph else 0)
             current_paragraph.append(cleaned)
         
         # Create paragraph breaks roughly every 30 seconds or at natural breaks
-        next_start = transcript[i + 1].get("start", 0) if i + 1 < len(transcript) else float("inf")
         time_gap = next_start - chunk_start
         
         # Paragraph break conditions
         should_break = (
             time_gap > 2.0 or  # Long pause
-            len(" ".join(current_paragraph)) > 500 or  # Long paragraph
+            current_len > 500 or  # Long paragraph
             text.endswith((".", "?", "!")) and len(current_paragraph) > 5
         )
         
         if should_break and current_paragraph:
             timestamp = f"[{int(current_start // 60)}:{int(current_start % 60):02d}]"
+            # Pieces are already cleaned, so joining them needs no cleanup
             paragraph_text = " ".join(current_paragraph)
-            # Final cleanup
-            paragraph_text = re.sub(r"\s+", " ", paragraph_text).strip()
             if paragraph_text:
                 merged_text.append(f"{timestamp} {paragraph_text}")
             current_paragraph = []
+            current_len = 0
             current_start = next_start
     
     # Add any remaining text
     if current_paragraph:
         timestamp = f"[{int(current_start // 60)}:{int(current_start % 60):02d}]"
         paragraph_text = " ".join(current_paragraph)
-        paragraph_text = re.sub(r"\s+", " ", paragraph_text).strip()
         if paragraph_text:
             merged_text.append(f"{timestamp} {paragraph_text}")
     
@@ -183,23 +277,63 @@ def extract_guest_name(title: str) -> Optional[str]:
     return None
 
 
+@lru_cache(maxsize=None)
+def get_encoding() -> tiktoken.Encoding:
+    """
+    Load the tokenizer on first use, so imports and runs that never
+    truncate don't pay for loading (or downloading) its BPE file.
+    """
+    return tiktoken.get_encoding(TOKENIZER_ENCODING)
+
+
 def truncate_transcript(text: str, max_tokens: int = 80000) -> str:
     """
     Truncate transcript to fit within token limits.
-    Rough estimate: 1 token ≈ 4 characters
+    Counts and cuts on real token boundaries with the gpt-4o tokenizer.
     """
-    max_chars = max_tokens * 4
-    if len(text) <= max_chars:
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
         return text
     
     # Take beginning and end portions
-    portion_size = max_chars // 2
-    beginning = text[:portion_size]
-    ending = text[-portion_size:]
+    portion_size = max_tokens // 2
+    beginning = encoding.decode(tokens[:portion_size])
+    ending = encoding.decode(tokens[-portion_size:])
     
     return f"{beginning}\n\n[... middle portion truncated for length ...]\n\n{ending}"
 
 
+def cache_key(model: str, system_msg: str, prompt: str) -> str:
+    """
+    Hash everything that determines a response: model, instructions and prompt.
+    """
+    return hashlib.sha256(f"{model}\0{system_msg}\0{prompt}".encode()).hexdigest()
+
+
+def cache_get(key: str):
+    """
+    Return the cached result for key, or None if there isn't one.
+    """
+    cache_path = INSIGHT_CACHE_DIR / f"{key}.json"
+    try:
+        return orjson.loads(cache_path.read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+
+
+def cache_set(key: str, result):
+    """
+    Store a result under key; written to a temp file first so concurrent
+    workers never see a partial entry.
+    """
+    INSIGHT_CACHE_DIR.mkdir(exist_ok=True)
+    cache_path = INSIGHT_CACHE_DIR / f"{key}.json"
+    tmp_path = cache_path.with_name(f"{key}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(orjson.dumps(result))
+    os.replace(tmp_path, cache_path)
+
+
 def extract_insights(client: OpenAI, transcript_text: str, title: str, guest: Optional[str], model: str = "gpt-4o-mini") -> list[dict]:
     """
     Stage 1: Extract key insights from the transcript.
@@ -211,11 +345,17 @@ def extract_insights(client: OpenAI, transcript_text: str, title: str, guest: Op
         guest=guest or "Solo episode (Andrew Huberman only)",
         transcript=truncated
     )
+    system_msg = "You are an expert at analyzing educational content and extracting key insights. Always respond with valid JSON."
+    
+    key = cache_key(model, system_msg, prompt)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
     
     response = client.chat.completions.create(
         model=model,
         messages=[
-            {"role": "system", "content": "You are an expert at analyzing educational content and extracting key insights. Always respond with valid JSON."},
+            {"role": "system", "content": system_msg},
             {"role": "user", "content": prompt}
         ],
         temperature=0.3,
@@ -227,14 +367,18 @@ def extract_insights(client: OpenAI, transcript_text: str, title: str, guest: Op
         # Handle both array and object responses
         parsed = json.loads(content)
         if isinstance(parsed, list):
-            return parsed
+            insights = parsed
         elif isinstance(parsed, dict) and "insights" in parsed:
-            return parsed["insights"]
+            insights = parsed["insights"]
         else:
-            return list(parsed.values())[0] if parsed else []
+            insights = list(parsed.values())[0] if parsed else []
     except json.JSONDecodeError:
-        print(f"  Warning: Failed to parse insights JSON, using raw content")
+        safe_print("  Warning: Failed to parse insights JSON, using raw content")
         return []
+    
+    if insights:
+        cache_set(key, insights)
+    return insights
 
 
 def generate_questions(client: OpenAI, insights: list[dict], title: str, guest: Optional[str], model: str = "gpt-4o-mini") -> dict:
@@ -248,11 +392,17 @@ def generate_questions(client: OpenAI, insights: list[dict], title: str, guest:
         guest=guest or "Solo episode (Andrew Huberman only)",
         insights=insights_text
     )
+    system_msg = "You are an expert quiz creator for educational games. Always respond with valid JSON."
+    
+    key = cache_key(model, system_msg, prompt)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
     
     response = client.chat.completions.create(
         model=model,
         messages=[
-            {"role": "system", "content": "You are an expert quiz creator for educational games. Always respond with valid JSON."},
+            {"role": "system", "content": system_msg},
             {"role": "user", "content": prompt}
         ],
         temperature=0.7,
@@ -261,54 +411,57 @@ def generate_questions(client: OpenAI, insights: list[dict], title: str, guest:
     
     content = response.choices[0].message.content
     try:
-        return json.loads(content)
+        questions_data = json.loads(content)
     except json.JSONDecodeError:
-        print(f"  Warning: Failed to parse questions JSON")
+        safe_print("  Warning: Failed to parse questions JSON")
         return {"questions": []}
+    
+    if questions_data.get("questions"):
+        cache_set(key, questions_data)
+    return questions_data
 
 
 def process_transcript_file(client: OpenAI, input_path: Path, output_dir: Path, model: str = "gpt-4o-mini") -> dict:
     """
     Process a single transcript file and generate questions.
     """
-    print(f"\nProcessing: {input_path.name}")
+    safe_print(f"\nProcessing: {input_path.name}")
     
     # Load transcript
-    with open(input_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = orjson.loads(input_path.read_bytes())
     
     video_id = data.get("video_id", "unknown")
     title = data.get("title", "Unknown Title")
-    transcript = data.get("transcript", [])
+    texts, starts = transcript_columns(data.get("transcript") or [])
     
-    if not transcript:
-        print(f"  Skipping: No transcript available")
+    if not texts:
+        safe_print("  Skipping: No transcript available")
         return None
     
     # Extract guest name
     guest = extract_guest_name(title)
-    print(f"  Title: {title}")
-    print(f"  Guest: {guest or 'Solo episode'}")
-    print(f"  Transcript chunks: {len(transcript)}")
+    safe_print(f"  Title: {title}")
+    safe_print(f"  Guest: {guest or 'Solo episode'}")
+    safe_print(f"  Transcript chunks: {len(texts)}")
     
     # Stage 1: Merge and extract insights
-    print(f"  Stage 1: Merging transcript and extracting insights...")
-    merged_text = merge_transcript_chunks(transcript)
-    print(f"  Merged text length: {len(merged_text):,} characters")
+    safe_print("  Stage 1: Merging transcript and extracting insights...")
+    merged_text = merge_transcript_chunks(texts, starts)
+    safe_print(f"  Merged text length: {len(merged_text):,} characters")
     
     insights = extract_insights(client, merged_text, title, guest, model)
-    print(f"  Extracted {len(insights)} insights")
+    safe_print(f"  Extracted {len(insights)} insights")
     
     if not insights:
-        print(f"  Warning: No insights extracted, skipping question generation")
+        safe_print("  Warning: No insights extracted, skipping question generation")
         return None
     
     # Stage 2: Generate questions
-    print(f"  Stage 2: Generating quiz questions...")
+    safe_print("  Stage 2: Generating quiz questions...")
     questions_data = generate_questions(client, insights, title, guest, model)
     
     questions = questions_data.get("questions", [])
-    print(f"  Generated {len(questions)} questions")
+    safe_print(f"  Generated {len(questions)} questions")
     
     # Build output
     output = {
@@ -323,10 +476,9 @@ def process_transcript_file(client: OpenAI, input_path: Path, output_dir: Path,
     
     # Save output
     output_path = output_dir / f"{input_path.stem}_questions.json"
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    atomic_write_json(output_path, output)
     
-    print(f"  Saved: {output_path.name}")
+    safe_print(f"  Saved: {output_path.name}")
     
     return output
 
@@ -336,6 +488,7 @@ def main():
     parser.add_argument("--input", "-i", required=True, help="Input directory or file pattern")
     parser.add_argument("--output", "-o", default="generated_questions", help="Output directory")
     parser.add_argument("--model", "-m", default="gpt-4o-mini", help="OpenAI model to use")
+    parser.add_argument("--workers", "-w", type=int, default=MAX_WORKERS, help="Files processed in parallel")
     args = parser.parse_args()
     
     # Initialize client
@@ -365,16 +518,16 @@ def main():
     print(f"Using model: {args.model}")
     print(f"Output directory: {output_dir}")
     
-    # Process each file
-    results = []
-    for input_file in input_files:
+    def process_one(input_file: Path) -> Optional[dict]:
         try:
-            result = process_transcript_file(client, input_file, output_dir, args.model)
-            if result:
-                results.append(result)
+            return process_transcript_file(client, input_file, output_dir, args.model)
         except Exception as e:
-            print(f"  Error processing {input_file.name}: {e}")
-            continue
+            safe_print(f"  Error processing {input_file.name}: {e}")
+            return None
+    
+    # Process files in parallel; map keeps results in input order
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = [result for result in executor.map(process_one, input_files) if result]
     
     # Save summary
     if results:
@@ -392,8 +545,7 @@ def main():
         }
         
         summary_path = output_dir / "_summary.json"
-        with open(summary_path, "w", encoding="utf-8") as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+        atomic_write_json(summary_path, summary)
         
         print(f"\n{'='*50}")
         print(f"Complete! Processed {len(results)} videos")
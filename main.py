@@ -1,32 +1,130 @@
-import json
+import asyncio
+import contextlib
 import io
 import zipfile
 import re
+import secrets
+import tempfile
 import time
 import os
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import MozillaCookieJar
 from pathlib import Path
 from typing import Optional
 
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import Depends, FastAPI, Request, Form, Header, HTTPException
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.background import BackgroundTask
+import orjson
+import requests
 import yt_dlp
-from youtube_transcript_api import YouTubeTranscriptApi
-
-# Initialize the transcript API with optional cookie support
+from diskcache import Cache, JSONDisk
+from youtube_transcript_api import (
+    NoTranscriptFound,
+    RequestBlocked,
+    TranscriptsDisabled,
+    VideoUnavailable,
+    YouTubeTranscriptApi,
+)
+
+# Transcript API cookies are optional
 # To use cookies, export them from your browser and save to cookies.txt
 COOKIES_FILE = Path(__file__).parent / "cookies.txt"
 if COOKIES_FILE.exists():
-    from http.cookiejar import MozillaCookieJar
-    cookie_jar = MozillaCookieJar(str(COOKIES_FILE))
-    cookie_jar.load()
-    transcript_api = YouTubeTranscriptApi(cookie_jar=cookie_jar)
     print(f"✓ Using cookies from {COOKIES_FILE}")
 else:
-    transcript_api = YouTubeTranscriptApi()
     print("⚠ No cookies.txt found - YouTube may block requests. See README for instructions.")
 
+# YouTubeTranscriptApi wraps a requests.Session and isn't thread-safe, so
+# each _POOL thread builds its own on first use
+_transcript_local = threading.local()
+
+
+def get_transcript_api() -> YouTubeTranscriptApi:
+    """Return this thread's YouTubeTranscriptApi, creating it on first use."""
+    api = getattr(_transcript_local, "api", None)
+    if api is None:
+        session = requests.Session()
+        if COOKIES_FILE.exists():
+            cookie_jar = MozillaCookieJar(str(COOKIES_FILE))
+            cookie_jar.load()
+            session.cookies = cookie_jar
+        api = _transcript_local.api = YouTubeTranscriptApi(http_client=session)
+    return api
+
+
+# On-disk cache of fetched transcripts, stored as zlib-compressed JSON.
+# Bump TRANSCRIPT_CACHE_VERSION whenever the cached transcript layout changes.
+TRANSCRIPT_CACHE_TTL = 7 * 24 * 3600  # 1 week
+TRANSCRIPT_CACHE_VERSION = 4
+cache = Cache(
+    str(Path(__file__).parent / ".cache" / "yt2rpg"),
+    disk=JSONDisk,
+    disk_compress_level=6,
+)
+
+# Shared secret for admin endpoints such as cache invalidation, sent in the
+# X-Admin-Token header; leave unset to disable those endpoints
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Transcripts fetched concurrently per request, and the pace of transcript
+# requests across all requests so YouTube doesn't block the server's IP.
+# Up to TRANSCRIPT_BURST requests may go out back to back before the
+# steady rate applies.
+MAX_CONCURRENT_FETCHES = 8
+TRANSCRIPT_REQUESTS_PER_SECOND = 2
+TRANSCRIPT_BURST = 4
+
+# Retries for a transcript fetch that YouTube rejected with a 429 / block,
+# waiting RETRY_BASE_DELAY * 2**attempt seconds between attempts
+MAX_FETCH_ATTEMPTS = 4
+RETRY_BASE_DELAY = 2.0
+
+
+class TokenBucket:
+    """
+    Event-loop token bucket: refills at `rate` tokens per second up to
+    `burst`, and each acquire() spends one token, sleeping if none is left.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = None
+
+    async def acquire(self):
+        # Created lazily so the lock belongs to the server's running loop
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                # Holding the lock while sleeping keeps waiters in FIFO order
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.last = time.monotonic()
+                self.tokens = 0
+            else:
+                self.tokens -= 1
+
+
+transcript_bucket = TokenBucket(TRANSCRIPT_REQUESTS_PER_SECOND, TRANSCRIPT_BURST)
+
+# Threads for the blocking yt-dlp and transcript calls, shared by all
+# requests. Sized so several concurrent /extract requests (each capped at
+# MAX_CONCURRENT_FETCHES) fit without queueing behind one another; the
+# default executor is only min(32, cpu_count + 4) threads.
+BLOCKING_WORKERS = 32
+_POOL = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="yt")
+
 app = FastAPI(title="YouTube Playlist Transcript Extractor")
 
 # Mount static files and templates
@@ -34,17 +132,92 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 
+class ZipStreamSink(io.RawIOBase):
+    """
+    Write-only, unseekable file for ZipFile. Reporting that it can't seek
+    makes ZipFile emit data descriptors instead of rewinding to patch
+    headers, so the bytes it writes can be sent on as soon as they arrive.
+    """
+
+    def __init__(self):
+        self.chunks = deque()
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        """Return and forget everything written since the last drain."""
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _write_json_entry(zip_file: zipfile.ZipFile, filename: str, obj, option: Optional[int] = None):
+    """
+    Serialize obj and add it to the ZIP. Run on _POOL: serialization and
+    deflate/LZMA are CPU-bound and would otherwise stall the event loop.
+    """
+    zip_file.writestr(filename, orjson.dumps(obj, option=option))
+
+
+# URL and filename patterns, compiled once at import; _LIST_RE matches
+# both watch?v=...&list=... and playlist?list=... URLs
+_LIST_RE = re.compile(r"[?&]list=([a-zA-Z0-9_-]+)")
+_UNSAFE = re.compile(r'[^\w\s-]')
+_VIDEO_ID_RE = re.compile(r"[A-Za-z0-9_-]{11}")
+
+# Playlists longer than this are built into a temp file and served from
+# disk; shorter ones are streamed to the client as they're built
+LARGE_PLAYLIST_VIDEOS = 100
+
+# ZIP compression choices offered by /extract, as (method, compresslevel).
+# Deflate's default level 6 dominates post-fetch CPU on big playlists;
+# "fast" trades some size for much less CPU, "stored" skips it entirely.
+# "lzma" is smallest but Windows Explorer and macOS Archive Utility can't
+# extract it (7-Zip can), so deflate stays the default.
+ZIP_COMPRESSION = {
+    "deflated": (zipfile.ZIP_DEFLATED, None),
+    "fast": (zipfile.ZIP_DEFLATED, 1),
+    "lzma": (zipfile.ZIP_LZMA, None),
+    "stored": (zipfile.ZIP_STORED, None),
+}
+
+
 def extract_playlist_id(url: str) -> Optional[str]:
     """Extract playlist ID from various YouTube URL formats."""
-    patterns = [
-        r"[?&]list=([a-zA-Z0-9_-]+)",
-        r"playlist\?list=([a-zA-Z0-9_-]+)",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
+    # Cheap substring check turns away non-playlist URLs before the regex
+    if "list=" not in url:
+        return None
+    match = _LIST_RE.search(url)
+    return match.group(1) if match else None
+
+
+# YoutubeDL instances reused across requests, one per thread and option set,
+# so extractor registration and HTTP session setup happen once per thread.
+# YoutubeDL isn't thread-safe (process_ie_result tracks in-progress
+# playlists on the instance), so threads never share one.
+_ydl_local = threading.local()
+
+
+def _get_ydl(opts: dict) -> yt_dlp.YoutubeDL:
+    """Return this thread's YoutubeDL for these options, creating it on first use."""
+    pool = getattr(_ydl_local, "pool", None)
+    if pool is None:
+        pool = _ydl_local.pool = {}
+    key = frozenset(opts.items())
+    ydl = pool.get(key)
+    if ydl is None:
+        ydl = pool[key] = yt_dlp.YoutubeDL(opts)
+    return ydl
 
 
 def get_playlist_videos(playlist_url: str, include_descriptions: bool = True) -> list[dict]:
@@ -74,11 +247,11 @@ def get_playlist_videos(playlist_url: str, include_descriptions: bool = True) ->
             "no_warnings": True,
         }
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        try:
-            result = ydl.extract_info(playlist_url, download=False)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed to fetch playlist: {str(e)}")
+    ydl = _get_ydl(ydl_opts)
+    try:
+        result = ydl.extract_info(playlist_url, download=False)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to fetch playlist: {str(e)}")
 
     if not result or "entries" not in result:
         raise HTTPException(status_code=400, detail="Could not find videos in playlist")
@@ -87,10 +260,12 @@ def get_playlist_videos(playlist_url: str, include_descriptions: bool = True) ->
     for entry in result.get("entries", []):
         if entry is None:
             continue
+        # Look up the id once and reuse it for the watch URL
+        video_id = entry.get("id")
         videos.append({
-            "video_id": entry.get("id"),
+            "video_id": video_id,
             "title": entry.get("title", "Unknown Title"),
-            "url": f"https://www.youtube.com/watch?v={entry.get('id')}",
+            "url": f"https://www.youtube.com/watch?v={video_id}",
             "duration": entry.get("duration"),
             "channel": entry.get("channel") or entry.get("uploader"),
             "description": entry.get("description", ""),
@@ -102,39 +277,57 @@ def get_playlist_videos(playlist_url: str, include_descriptions: bool = True) ->
     return videos
 
 
+def transcript_cache_key(video_id: str) -> str:
+    return f"transcript:v{TRANSCRIPT_CACHE_VERSION}:{video_id}"
+
+
 def get_video_transcript(video_id: str) -> dict:
     """
-    Fetch transcript for a single video.
+    Fetch transcript for a single video from YouTube.
     Returns dict with transcript data or error information.
+    Successful fetches are cached on disk; failures are always retried.
+    Callers check the cache first, so hits never spend a rate-limit token.
     """
+    cache_key = transcript_cache_key(video_id)
+    rate_limited = False
     try:
-        result = transcript_api.fetch(video_id)
-        # Convert FetchedTranscript items to dicts
-        transcript_list = [
-            {
-                "text": item.text,
-                "start": item.start,
-                "duration": item.duration,
-            }
-            for item in result
-        ]
-        return {
+        result = get_transcript_api().fetch(video_id)
+        # Store the transcript column-wise: one list per field instead of a
+        # dict per caption repeating the same three keys. Times are whole
+        # milliseconds; captions are only ~10 ms precise, and ints encode
+        # faster and shorter than floats like 1.2339999999999998
+        texts, starts, durations = [], [], []
+        for item in result:
+            texts.append(item.text)
+            starts.append(int(item.start * 1000 + 0.5))
+            durations.append(int(item.duration * 1000 + 0.5))
+        transcript_result = {
             "success": True,
-            "transcript": transcript_list,
+            "transcript": {
+                "units": "ms",
+                "texts": texts,
+                "starts": starts,
+                "durations": durations,
+            },
         }
+        cache.set(cache_key, transcript_result, expire=TRANSCRIPT_CACHE_TTL)
+        return transcript_result
+    # Provide friendlier error messages for common cases
+    except TranscriptsDisabled:
+        error_message = "Transcripts are disabled for this video"
+    except NoTranscriptFound:
+        error_message = "No transcript found for this video"
+    except VideoUnavailable:
+        error_message = "Video is unavailable"
     except Exception as e:
         error_message = str(e)
-        # Provide friendlier error messages for common cases
-        if "disabled" in error_message.lower():
-            error_message = "Transcripts are disabled for this video"
-        elif "no transcript" in error_message.lower():
-            error_message = "No transcript found for this video"
-        elif "unavailable" in error_message.lower():
-            error_message = "Video is unavailable"
-        return {
-            "success": False,
-            "error": error_message,
-        }
+        # 429s and bot checks surface as RequestBlocked (IpBlocked included)
+        rate_limited = isinstance(e, RequestBlocked)
+    return {
+        "success": False,
+        "error": error_message,
+        "rate_limited": rate_limited,
+    }
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -147,6 +340,7 @@ async def home(request: Request):
 async def extract_transcripts(
     playlist_url: str = Form(...),
     include_description: bool = Form(default=True),
+    compression: str = Form(default="deflated"),
 ):
     """
     Extract transcripts from all videos in a playlist.
@@ -156,6 +350,7 @@ async def extract_transcripts(
         playlist_url: YouTube playlist URL
         include_description: If True, fetch full video descriptions (slower).
                            If False, skip descriptions for faster extraction.
+        compression: One of ZIP_COMPRESSION's keys, choosing the ZIP method.
     """
     # Validate playlist URL
     playlist_id = extract_playlist_id(playlist_url)
@@ -164,39 +359,70 @@ async def extract_transcripts(
             status_code=400,
             detail="Invalid playlist URL. Please provide a valid YouTube playlist URL."
         )
+    if compression not in ZIP_COMPRESSION:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid compression. Choose one of: {', '.join(ZIP_COMPRESSION)}."
+        )
+    zip_method, zip_level = ZIP_COMPRESSION[compression]
+
+    loop = asyncio.get_running_loop()
 
     # Get all videos in the playlist (with descriptions if requested)
-    videos = get_playlist_videos(playlist_url, include_descriptions=include_description)
+    videos = await loop.run_in_executor(_POOL, get_playlist_videos, playlist_url, include_description)
     
     if not videos:
         raise HTTPException(status_code=400, detail="No videos found in playlist")
 
-    # Create a ZIP file in memory
-    zip_buffer = io.BytesIO()
-    
-    results_summary = {
-        "total_videos": len(videos),
-        "successful": 0,
-        "failed": 0,
-        "videos": [],
-    }
+    # Fetch transcripts concurrently; the blocking API calls run on _POOL,
+    # paced by transcript_bucket
+    semaphore = asyncio.BoundedSemaphore(MAX_CONCURRENT_FETCHES)
+
+    async def fetch_one(video: dict) -> Optional[dict]:
+        video_id = video["video_id"]
+        if not video_id:
+            return None
+        # Cached transcripts skip the semaphore and the token bucket
+        cached = await loop.run_in_executor(_POOL, cache.get, transcript_cache_key(video_id))
+        if cached is not None:
+            return cached
+        async with semaphore:
+            for attempt in range(MAX_FETCH_ATTEMPTS):
+                await transcript_bucket.acquire()
+                transcript_result = await loop.run_in_executor(_POOL, get_video_transcript, video_id)
+                if not transcript_result.get("rate_limited"):
+                    break
+                # Back off exponentially when YouTube pushes back
+                if attempt + 1 < MAX_FETCH_ATTEMPTS:
+                    await asyncio.sleep(RETRY_BASE_DELAY * 2 ** attempt)
+            return transcript_result
+
+    fetch_tasks = [asyncio.ensure_future(fetch_one(video)) for video in videos]
+
+    async def write_entries(zip_file: zipfile.ZipFile):
+        """
+        Write each video's JSON into the ZIP as soon as its transcript (and
+        all earlier ones) are ready, yielding after every entry, then add
+        the summary file.
+        """
+        results_summary = {
+            "total_videos": len(videos),
+            "successful": 0,
+            "failed": 0,
+            "videos": [],
+        }
 
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for i, video in enumerate(videos):
+        # Results are written in playlist order from this task only;
+        # ZipFile isn't safe to write from several threads
+        for i, (video, fetch_task) in enumerate(zip(videos, fetch_tasks)):
             video_id = video["video_id"]
+            transcript_result = await fetch_task
             
             if not video_id:
                 continue
 
-            # Delay between requests to avoid rate limiting
-            # YouTube may block IPs that make too many requests too quickly
-            if i > 0:
-                time.sleep(2.0)
-
-            # Get transcript
-            transcript_result = get_video_transcript(video_id)
-
             # Prepare JSON data for this video
+            success = transcript_result["success"]
             video_data = {
                 "video_id": video_id,
                 "title": video["title"],
@@ -208,10 +434,10 @@ async def extract_transcripts(
                 "view_count": video.get("view_count"),
                 "upload_date": video.get("upload_date"),
                 "playlist_url": playlist_url,
-                "transcript_available": transcript_result["success"],
+                "transcript_available": success,
             }
 
-            if transcript_result["success"]:
+            if success:
                 video_data["transcript"] = transcript_result["transcript"]
                 results_summary["successful"] += 1
             else:
@@ -221,36 +447,104 @@ async def extract_transcripts(
             results_summary["videos"].append({
                 "video_id": video_id,
                 "title": video["title"],
-                "success": transcript_result["success"],
+                "success": success,
             })
 
-            # Create safe filename
-            safe_title = re.sub(r'[^\w\s-]', '', video["title"])[:50].strip()
+            # Create safe filename (slice first so long titles aren't scanned in full)
+            safe_title = _UNSAFE.sub('', video["title"][:50]).strip()
             filename = f"{i+1:03d}_{safe_title}_{video_id}.json"
 
-            # Add JSON file to ZIP
-            json_content = json.dumps(video_data, indent=2, ensure_ascii=False)
-            zip_file.writestr(filename, json_content)
+            # Add JSON file to ZIP and let the caller pass it on. Per-video
+            # files are compact: they're read by scripts, and indenting
+            # would only give deflate more bytes to chew through. Each write
+            # is awaited before the next, so only one thread touches the ZIP
+            await loop.run_in_executor(_POOL, _write_json_entry, zip_file, filename, video_data)
+            yield
 
-        # Add a summary file
-        summary_content = json.dumps(results_summary, indent=2, ensure_ascii=False)
-        zip_file.writestr("_summary.json", summary_content)
+        # Add a summary file, indented since people read it
+        await loop.run_in_executor(
+            _POOL, _write_json_entry, zip_file, "_summary.json", results_summary, orjson.OPT_INDENT_2
+        )
 
-    # Prepare the ZIP for download
-    zip_buffer.seek(0)
+    async def generate_zip():
+        """
+        Stream the archive, sending each entry's compressed bytes straight
+        to the client instead of holding the whole archive in memory.
+        """
+        sink = ZipStreamSink()
+        try:
+            with zipfile.ZipFile(sink, "w", zip_method, compresslevel=zip_level) as zip_file:
+                async for _ in write_entries(zip_file):
+                    yield sink.drain()
+            # Closing the ZipFile writes the central directory
+            yield sink.drain()
+        finally:
+            # Stop outstanding fetches if the client goes away mid-download
+            for fetch_task in fetch_tasks:
+                fetch_task.cancel()
 
     # Generate filename from playlist ID
     zip_filename = f"transcripts_{playlist_id}.zip"
+    headers = {"Content-Disposition": f"attachment; filename={zip_filename}"}
 
-    return StreamingResponse(
-        zip_buffer,
+    if len(videos) <= LARGE_PLAYLIST_VIDEOS:
+        return StreamingResponse(generate_zip(), media_type="application/zip", headers=headers)
+
+    # Large playlists are built in a temp file first and then served with
+    # FileResponse, so the download doesn't pass every byte through Python.
+    # All file I/O and compression runs on _POOL to keep the loop free.
+    tmp = await loop.run_in_executor(_POOL, partial(tempfile.NamedTemporaryFile, delete=False, suffix=".zip"))
+    built = False
+    try:
+        with tmp:
+            zip_file = zipfile.ZipFile(tmp, "w", zip_method, compresslevel=zip_level)
+            try:
+                async for _ in write_entries(zip_file):
+                    pass
+            except BaseException:
+                # Close before tmp does, or ZipFile.__del__ later seeks a closed file
+                with contextlib.suppress(Exception):
+                    zip_file.close()
+                raise
+            # Closing the ZipFile writes the central directory
+            await loop.run_in_executor(_POOL, zip_file.close)
+        built = True
+    finally:
+        for fetch_task in fetch_tasks:
+            fetch_task.cancel()
+        # A failed or cancelled build never reaches FileResponse's cleanup
+        if not built:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp.name)
+
+    return FileResponse(
+        tmp.name,
         media_type="application/zip",
-        headers={
-            "Content-Disposition": f"attachment; filename={zip_filename}"
-        }
+        headers=headers,
+        background=BackgroundTask(os.unlink, tmp.name),
     )
 
 
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Dependency for admin endpoints: the X-Admin-Token header must match
+    ADMIN_TOKEN. With no ADMIN_TOKEN configured the endpoints are disabled.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.post("/cache/invalidate/{video_id}", dependencies=[Depends(require_admin)])
+async def invalidate_cache(video_id: str):
+    """Drop a video's cached transcript so the next extraction refetches it."""
+    if not _VIDEO_ID_RE.fullmatch(video_id):
+        raise HTTPException(status_code=400, detail="Invalid video ID")
+    removed = cache.delete(transcript_cache_key(video_id))
+    return {"video_id": video_id, "invalidated": removed}
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for deployment platforms."""
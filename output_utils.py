@@ -0,0 +1,73 @@
+"""
+Helpers for writing script output: atomic JSON files and the append-only
+_summary.jsonl log that _summary.json is rendered from.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import orjson
+
+# Append-only log of per-video results; _summary.json is rendered from it
+SUMMARY_LOG = "_summary.jsonl"
+summary_lock = threading.Lock()
+
+
+def atomic_write_json(path: Path, obj):
+    """
+    Write obj as indented JSON via a temp file and os.replace, so a crash
+    mid-write never leaves a truncated file at path.
+    """
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, path)
+
+
+def append_summary_entry(output_path: Path, entry: dict):
+    """
+    Append one video's record to the append-only _summary.jsonl log.
+    """
+    line = orjson.dumps(entry) + b"\n"
+    with summary_lock:
+        with open(output_path / SUMMARY_LOG, 'ab') as f:
+            f.write(line)
+
+
+def migrate_legacy_summary(output_path: Path):
+    """
+    Seed _summary.jsonl from a _summary.json written by older versions.
+    """
+    log_path = output_path / SUMMARY_LOG
+    legacy_path = output_path / "_summary.json"
+    if log_path.exists() or not legacy_path.exists():
+        return
+    legacy_summary = orjson.loads(legacy_path.read_bytes())
+    with open(log_path, 'wb') as f:
+        for entry in legacy_summary.get("videos", []):
+            f.write(orjson.dumps(entry) + b"\n")
+
+
+def load_summary(output_path: Path) -> dict:
+    """
+    Stream the _summary.jsonl log into aggregate counts.
+    If a video was recorded more than once, its latest record wins.
+    Only a success flag per file is held in memory; the per-video
+    records themselves stay in the log.
+    """
+    outcomes = {}
+    log_path = output_path / SUMMARY_LOG
+    if log_path.exists():
+        with open(log_path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    entry = orjson.loads(line)
+                    outcomes[entry["filename"]] = entry["success"]
+    
+    successful = sum(outcomes.values())
+    return {
+        "total_videos": len(outcomes),
+        "successful": successful,
+        "failed": len(outcomes) - successful,
+        "videos_log": SUMMARY_LOG,
+    }
@@ -0,0 +1,63 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+pytest.importorskip("openai")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import fetch_with_whisper  # noqa: E402
+
+PLAYLIST_ID = "PLtest123"
+WATCH_URL = f"https://www.youtube.com/watch?v=abcdefghijk&list={PLAYLIST_ID}"
+TAB_URL = f"https://www.youtube.com/playlist?list={PLAYLIST_ID}"
+
+
+class FakeYoutubeDL:
+    """
+    Mimics extract_info(process=False): a watch?list= URL comes back as a
+    "url" redirect to the tab extractor, which returns the playlist.
+    """
+
+    def __init__(self, opts):
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=True, ie_key=None, process=True):
+        assert process is False
+        self.calls.append((url, ie_key))
+        if url == WATCH_URL:
+            return {"_type": "url", "url": TAB_URL, "ie_key": "YoutubeTab"}
+        if url == TAB_URL:
+            entries = ({"id": f"vid{i:08d}", "title": f"Video {i}"} for i in range(3))
+            return {"_type": "playlist", "id": PLAYLIST_ID, "entries": entries}
+        return {"_type": "video", "id": "abcdefghijk"}
+
+
+def test_resolve_playlist_follows_url_redirect():
+    ydl = FakeYoutubeDL({})
+    result = fetch_with_whisper.resolve_playlist(ydl, WATCH_URL)
+    assert result["_type"] == "playlist"
+    assert ydl.calls == [(WATCH_URL, None), (TAB_URL, "YoutubeTab")]
+
+
+def test_get_playlist_videos_from_watch_list_url(monkeypatch):
+    monkeypatch.setattr(fetch_with_whisper.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    videos = list(fetch_with_whisper.get_playlist_videos(WATCH_URL, max_videos=2))
+    assert [video["video_id"] for video in videos] == ["vid00000000", "vid00000001"]
+    assert videos[0]["url"] == "https://www.youtube.com/watch?v=vid00000000"
+
+
+def test_get_playlist_videos_rejects_single_video(monkeypatch):
+    monkeypatch.setattr(fetch_with_whisper.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    with pytest.raises(Exception, match="Could not find videos"):
+        list(fetch_with_whisper.get_playlist_videos("https://youtu.be/abcdefghijk"))
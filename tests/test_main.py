@@ -0,0 +1,150 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("diskcache")
+pytest.importorskip("youtube_transcript_api")
+pytest.importorskip("yt_dlp")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+# main.py mounts static/ and templates/ relative to the working directory
+os.chdir(REPO_ROOT)
+
+import main  # noqa: E402
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLtest123"
+
+
+class NoCache:
+    """Stands in for the disk cache so every lookup misses."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, expire=None):
+        pass
+
+
+@pytest.fixture
+def fake_playlist(monkeypatch):
+    """Serve a three-video playlist whose transcripts come back instantly."""
+    videos = [
+        {
+            "video_id": f"vid{i:08d}",
+            "title": f"Video {i}",
+            "url": f"https://www.youtube.com/watch?v=vid{i:08d}",
+        }
+        for i in range(3)
+    ]
+
+    def get_video_transcript(video_id):
+        return {
+            "success": True,
+            "transcript": {"units": "ms", "texts": [video_id], "starts": [0], "durations": [1000]},
+        }
+
+    monkeypatch.setattr(main, "get_playlist_videos", lambda url, include_descriptions: videos)
+    monkeypatch.setattr(main, "get_video_transcript", get_video_transcript)
+    monkeypatch.setattr(main, "cache", NoCache())
+    monkeypatch.setattr(main, "transcript_bucket", main.TokenBucket(rate=1000, burst=1000))
+    return videos
+
+
+@pytest.fixture
+def temp_zip_paths(monkeypatch):
+    """Record the paths of the temp files /extract creates."""
+    paths = []
+    real_named_temporary_file = tempfile.NamedTemporaryFile
+
+    def named_temporary_file(*args, **kwargs):
+        tmp = real_named_temporary_file(*args, **kwargs)
+        paths.append(tmp.name)
+        return tmp
+
+    monkeypatch.setattr(main.tempfile, "NamedTemporaryFile", named_temporary_file)
+    return paths
+
+
+def extract(client: TestClient):
+    return client.post("/extract", data={"playlist_url": PLAYLIST_URL, "include_description": "false"})
+
+
+def test_streamed_zip_round_trips(fake_playlist):
+    response = extract(TestClient(main.app))
+    assert response.status_code == 200
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
+        assert zip_file.testzip() is None
+        infos = zip_file.infolist()
+        names = [info.filename for info in infos]
+        assert names == [
+            "001_Video 0_vid00000000.json",
+            "002_Video 1_vid00000001.json",
+            "003_Video 2_vid00000002.json",
+            "_summary.json",
+        ]
+        # The sink can't seek, so sizes follow each entry in a data descriptor
+        assert all(info.flag_bits & 0x08 for info in infos)
+        assert b'"texts":["vid00000001"]' in zip_file.read(names[1])
+
+
+def test_zip_stream_sink_drains_written_bytes():
+    sink = main.ZipStreamSink()
+    assert not sink.seekable()
+    sink.write(b"abc")
+    sink.write(memoryview(b"de"))
+    assert sink.tell() == 5
+    assert sink.drain() == b"abcde"
+    assert sink.drain() == b""
+    assert sink.tell() == 5
+
+
+def test_token_bucket_paces_after_burst():
+    async def timed_acquires(bucket, count):
+        stamps = []
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+            stamps.append(time.monotonic() - start)
+        return stamps
+
+    stamps = asyncio.run(timed_acquires(main.TokenBucket(rate=20, burst=2), 6))
+    # The burst goes out at once; the remaining 4 tokens refill at 20/s
+    assert stamps[1] < 0.03
+    assert 0.17 <= stamps[-1] < 0.4
+
+
+def test_large_playlist_temp_file_removed_after_download(fake_playlist, temp_zip_paths, monkeypatch):
+    monkeypatch.setattr(main, "LARGE_PLAYLIST_VIDEOS", 0)
+    response = extract(TestClient(main.app))
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
+        assert len(zip_file.namelist()) == 4
+
+    assert len(temp_zip_paths) == 1
+    assert not os.path.exists(temp_zip_paths[0])
+
+
+def test_large_playlist_temp_file_removed_when_build_fails(fake_playlist, temp_zip_paths, monkeypatch):
+    monkeypatch.setattr(main, "LARGE_PLAYLIST_VIDEOS", 0)
+
+    def failing_write(zip_file, filename, obj, option=None):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(main, "_write_json_entry", failing_write)
+    with pytest.raises(RuntimeError, match="disk full"):
+        extract(TestClient(main.app))
+
+    assert len(temp_zip_paths) == 1
+    assert not os.path.exists(temp_zip_paths[0])